@@ -4,276 +4,430 @@
 # In[7]:
 
 
+import numpy as np
+
+_GEOMETRY = {}
+
+class BoardGeometry:
+    """
+    Everything about a row * column board that does not depend on the moves
+    played, computed once per board size (see geometry()) and shared by every
+    board of that size.  Edges are numbered in the order of the binary string:
+    each row of horizontal edges is followed by the row of vertical edges
+    below it.  Example:
+    my_geometry.horizontal[i] is True if edge i is horizontal
+    my_geometry.row_end[i] is True if edge i is the last edge of its row
+    my_geometry.box_edges[b] are the top, left, right and bottom edges of box b
+    my_geometry.edge_box_indices[i] are the one or two boxes edge i borders
+    my_geometry.edge_bits, box_masks and edge_boxes are the bitboard masks
+      returned by edge_masks()
+    my_geometry.symmetries['rotate'] is the order of the edges after rotating
+      the board, likewise for 'nothing', 'horizontal_flip' and
+      'vertical_flip' (rotations only make sense on square boards)
+    my_geometry.render(state) draws a board as text and render_batch(states)
+      draws a whole array of states at once
+    my_geometry.free_moves[k] is (shift, table) for bits shift to shift+11 of
+      the state, from the highest chunk down, where table[(state >> shift) &
+      4095] lists the undrawn edges among those bits in increasing order
+    """
+
+    def __init__ ( self, row, column ):
+        self.r = row
+        self.c = column
+        self.lines = column + ((2*column)+1)*row
+        self.edge_bits = tuple(1 << (self.lines-1-i) for i in range(self.lines))
+
+        period = 2*column + 1
+        self.horizontal = tuple(i % period < column for i in range(self.lines))
+        self.row_end = tuple(i % period in (column - 1, period - 1) for i in range(self.lines))
+        self.top_edges = tuple(i*period + j for i in range(row) for j in range(column))
+        self.horizontal_edges = tuple(i for i in range(self.lines) if self.horizontal[i])
+        self.row_ends = tuple(i for i in range(self.lines) if self.row_end[i])
+
+        self.box_edges = tuple((top, top+column, top+column+1, top+period) for top in self.top_edges)
+        edge_box_indices = [[] for i in range(self.lines)]
+        for b, edges in enumerate(self.box_edges):
+            for e in edges:
+                edge_box_indices[e].append(b)
+        self.edge_box_indices = tuple(tuple(boxes) for boxes in edge_box_indices)
+        self.box_masks = tuple(sum(self.edge_bits[e] for e in edges) for edges in self.box_edges)
+        self.edge_boxes = tuple(tuple(self.box_masks[b] for b in boxes) for boxes in self.edge_box_indices)
+        shifts = range(max(12, (self.lines - 1) // 12 * 12), -1, -12)
+        self.free_moves = tuple((shift, self.free_table(shift)) for shift in shifts)
+
+        self.symmetries = { 'nothing': tuple(range(self.lines)),
+                            'horizontal_flip': self.horizontal_flip(),
+                            'vertical_flip': self.vertical_flip(),
+                            'rotate': self.rotate() }
+
+        drawn, undrawn = [], []
+        for i in range(self.lines):
+            if self.horizontal[i]:
+                drawn.append('+---+\n' if self.row_end[i] else '+---')
+                undrawn.append('+   +\n' if self.row_end[i] else '+   ')
+            else:
+                drawn.append('|\n' if self.row_end[i] else '|   ')
+                undrawn.append(' \n' if self.row_end[i] else '    ')
+        self.pieces = tuple(zip(undrawn, drawn))
+        self.drawn_chars = np.frombuffer(''.join(drawn).encode(), dtype=np.uint8)
+        self.undrawn_chars = np.frombuffer(''.join(undrawn).encode(), dtype=np.uint8)
+        self.char_edges = np.repeat(np.arange(self.lines), [len(piece) for piece in drawn])
+
+    def free_table(self, shift):
+        """Lists the undrawn edges among the bits shift to shift+11 of a state for each of their values"""
+        width = max(0, min(12, self.lines - shift))
+        return tuple(tuple(self.lines-1-shift-k for k in range(width-1, -1, -1) if not value >> k & 1)
+                     for value in range(1 << width))
+
+    def horizontal_flip(self):
+        """The index positions of the moves reordered after a horizontal flip of the board"""
+        H = []
+        x = self.c - 1
+        while True:
+            for i in range(self.c):
+                H.append(x)
+                x-=1
+                
+            if len(H) == self.lines:
+                return tuple(H)
+                
+            x += 2*self.c + 1
+            
+            for i in range(self.c+1):
+                H.append(x)
+                x -= 1
+                
+            x += 2*self.c + 1
+
+    def vertical_flip(self):
+        """The index positions of the moves reordered after a vertical flip of the board"""
+        V = []
+        x = self.lines - self.c
+        
+        while True:
+            y = x
+            for i in range(self.c):
+                V.append(y)
+                y += 1
+                
+            x -= self.c + 1
+            y = x
+            
+            if len(V) == self.lines:
+                return tuple(V)
+                
+            for i in range(self.c+1):
+                V.append(y)
+                y += 1
+            
+            x -= self.c
+
+    def rotate(self):
+        """The index positions of the moves reordered after a rotation of the board"""
+        R = []
+        x = self.lines - 2*self.c - 1
+        y = self.lines - self.c
+        
+        while True:
+            a = x
+            for i in range(self.c):
+                R.append(a)
+                a -= 2*self.c + 1
+        
+            x += 1
+            
+            if len(R) == self.lines:
+                return tuple(R)
+            
+            b = y
+            for i in range(self.c+1):
+                R.append(b)
+                b -= 2*self.c + 1 
+                
+            y +=1
+
+    def render(self, state):
+        """Draws the edges of an integer state as text, one line of the drawing per row of edges"""
+        return ''.join([ pieces[(state >> shift) & 1] for pieces, shift in zip(self.pieces, range(self.lines-1, -1, -1)) ])
+
+    def render_batch(self, states):
+        """Draws an array of integer states at once and returns their drawings as a list of strings"""
+        states = np.asarray(states, dtype=np.int64)
+        shifts = self.lines - 1 - self.char_edges
+        drawn = ((states[:, None] >> shifts) & 1).astype(bool)
+        chars = np.where(drawn, self.drawn_chars, self.undrawn_chars)
+        return [ row.tobytes().decode() for row in chars ]
+
+
+def geometry(row, column):
+    """Returns the BoardGeometry of row * column boards, built the first time it is asked for"""
+    if (row, column) not in _GEOMETRY:
+        _GEOMETRY[(row, column)] = BoardGeometry(row, column)
+    return _GEOMETRY[(row, column)]
+
+def edge_masks(row, column):
+    """Returns the bitboard masks of a row * column board, computed once per board size and shared by every instance.
+    Edge i of the binary string is bit lines-1-i of the integer state, so that int(show_board(), 2) is the state.
+    The result is a tuple (edge_bits, box_masks, edge_boxes) where edge_boxes[i] holds the masks of the one or two
+    boxes bordered by edge i"""
+    shape = geometry(row, column)
+    return shape.edge_bits, shape.box_masks, shape.edge_boxes
+
+def state_id(board):
+    """Returns the integer encoding of a board given as a DotsBoard, as a binary string like the one show_board()
+    returns, or as an integer"""
+    if isinstance(board, DotsBoard):
+        return board.state
+    if isinstance(board, str):
+        return int(board, 2)
+    return int(board)
+
+
 class DotsBoard:
+    """
+    A Dots and Boxes board packed into one integer: edge i is played when bit
+    lines-1-i of self.state is set.  Example:
+    my_board.play(3) draws edge 3, scores the boxes it completes for the
+      player to move and hands the turn over if it completed none
+    my_board.undo() takes the last move back, restoring the state, score, turn
+      and move history
+    my_board.copy() returns an independent board in constant time; the list
+      of played moves is shared until one of the two boards plays again
+    my_board.legal_moves() reads the undrawn edges off the state with the
+      tables of BoardGeometry.free_moves, so play() keeps no list of them
+    my_board.geometry is the BoardGeometry shared by every board of its size
+    Boards hold no growing containers, so a search can play and undo moves on
+    one board instead of copying it at every node.
+    """
+
+    __slots__ = ('r', 'c', 'lines', 'turn', 'state', 'boxes', 'score1', 'score2',
+                 'geometry', 'edge_bits', 'box_masks', 'edge_boxes', 'high_moves', 'low_moves', 'moves', 'played', 'owns_moves')
+
     def __init__(self, row, column):
         self.r = row
         self.c = column
         self.lines = column + ((2*column)+1)*row
         self.turn = 0
-        self.board = list('0'*self.lines)
+        self.state = 0
+        self.boxes = 0
+        self.geometry = geometry(row, column)
+        self.edge_bits, self.box_masks, self.edge_boxes = edge_masks(row, column)
+        self.high_moves = self.geometry.free_moves[0][1]
+        self.low_moves = self.geometry.free_moves[-1][1]
         self.score1 = 0
         self.score2 = 0
-        self.orderofmoves = []
-        self.index_pos_list = []
+        self.moves = [0] * self.lines
+        self.played = 0
+        self.owns_moves = True
         
     def __repr__(self):
-        return f'{self.r}*{self.c} Board:{"".join(self.board)}'
+        return f'{self.r}*{self.c} Board:{self.show_board()}'
+
+    @property
+    def board(self):
+        """A list view of the bitboard with one '0' or '1' character per edge"""
+        return list(self.show_board())
+
+    @board.setter
+    def board(self, binary):
+        self.read_board(binary)
+
+    @property
+    def orderofmoves(self):
+        """The moves played so far, see .order()"""
+        return self.order()
         
     def get_index_positions(self, binary, element):
         ''' Returns the indexes of all occurrences of give element in
         the a list. This is used in the creation of symmetries in order to minimize computation '''
-        self.board = list(binary)
-        index_pos_list = []
-        index_pos = 0
-    
-        while True:
-            try:
-                # Search for item in list from indexPos to the end of list
-                index_pos = self.board.index(element,index_pos)
-                # Add the index position in list
-                self.index_pos_list.append(index_pos)
-                index_pos += 1
-            except ValueError as e:
-                break
+        self.read_board(binary)
+        return [ index_pos for index_pos, value in enumerate(binary) if value == element ]
                 
     def show_board(self):
-     """Returns a string showing all played moves on a board, the format of a will be in binary where a 0 represents an unplayed
-     move and a 1 represents a played move"""
-        return ("".join(self.board))
+        """Returns a string showing all played moves on a board, the format of a will be in binary where a 0 represents an unplayed
+        move and a 1 represents a played move"""
+        return format(self.state, 'b').zfill(self.lines)
     
     def read_board(self,binary):
-     """Takes a string input and can read it into an exits Dots instance"""
-        self.board = list(binary)
+        """Takes a string input and can read it into an exits Dots instance.  The move history starts over from there,
+        so moves played before cannot be undone"""
+        self.state = int(''.join(binary), 2)
+        self.boxes = sum(1 for mask in self.box_masks if self.state & mask == mask)
+        self.moves = [0] * self.lines
+        self.played = 0
+        self.owns_moves = True
 
     def copy(self):
-    """Returns a copy of the current instance of the Dots Board """
-        result = Dots(self.r,self.c)
-        result.read_board(self.show_board())
+        """Returns a copy of the current instance of the Dots Board in constant time.  Both boards keep the same move
+        history until one of them plays, which then takes its own copy"""
+        result = DotsBoard.__new__(DotsBoard)
+        result.r = self.r
+        result.c = self.c
+        result.lines = self.lines
+        result.turn = self.turn
+        result.state = self.state
+        result.boxes = self.boxes
+        result.score1 = self.score1
+        result.score2 = self.score2
+        result.geometry = self.geometry
+        result.edge_bits = self.edge_bits
+        result.box_masks = self.box_masks
+        result.edge_boxes = self.edge_boxes
+        result.high_moves = self.high_moves
+        result.low_moves = self.low_moves
+        result.moves = self.moves
+        result.played = self.played
+        result.owns_moves = self.owns_moves = False
         return result
            
     def whose_turn(self):
-    """Returns which players turn it is """
+        """Returns which players turn it is """
         if self.turn == 0:
             return 1
         else:
             return 2
 
+    def completed(self, move):
+        """Returns the number of boxes bordered by move that are complete in the current state"""
+        state = self.state
+        completed = 0
+        for mask in self.edge_boxes[move]:
+            if state & mask == mask:
+                completed += 1
+        return completed
+
     def play(self, move):
-    """Plays a moves and checks whether the move scored any boxes to assign that to the correct player and change turns. Moves are taken as a 
-    int input which references an index of a binary string of the board"""
-        before = self.score()
-        if self.board[move] =='0':
-            self.board[move]='1'
-            self.orderofmoves.append(move)
-            after = self.score()
+        """Plays a moves and checks whether the move scored any boxes to assign that to the correct player and change turns. Moves are taken as a 
+        int input which references an index of a binary string of the board"""
+        state = self.state
+        bit = self.edge_bits[move]
+        if not state & bit:
+            self.state = state = state | bit
+            if not self.owns_moves:
+                self.moves = self.moves[:]
+                self.owns_moves = True
+            self.moves[self.played] = move
+            self.played += 1
+            completed = 0
+            for mask in self.edge_boxes[move]:
+                if state & mask == mask:
+                    completed += 1
             
-            if before != after:
+            if completed:
+                self.boxes += completed
                 if self.turn == 0:
-                    self.score1 += 1
+                    self.score1 += completed
                 else:
-                    self.score2 += 1
+                    self.score2 += completed
             else:
-                if self.turn == 0:
-                    self.turn = 1
-                else:
-                    self.turn = 0
+                self.turn ^= 1
         else:
             pass
+
+    def undo(self):
+        """Takes back the last move played, restoring the state, the score and the turn, and returns it.  A move that
+        completed boxes kept the turn, so the player to move gets those boxes back; any other move handed the turn
+        over, so it goes back.  Returns None when there is nothing to undo"""
+        if self.played == 0:
+            return None
+        if not self.owns_moves:
+            self.moves = self.moves[:]
+            self.owns_moves = True
+        self.played -= 1
+        move = self.moves[self.played]
+        completed = self.completed(move)
+        self.state &= ~self.edge_bits[move]
+
+        if completed:
+            self.boxes -= completed
+            if self.turn == 0:
+                self.score1 -= completed
+            else:
+                self.score2 -= completed
+        else:
+            if self.turn == 0:
+                self.turn = 1
+            else:
+                self.turn = 0
+        return move
    
     def dimensions(self):
-    """Returns the dimensions, row * column, of the board"""
+        """Returns the dimensions, row * column, of the board"""
         dimensions = str(self.r) + ' * ' + str(self.c)
         return dimensions
    
     def moves_remaining(self):
-    """Returns the number of moves remaining"""
+        """Returns the number of moves remaining"""
         return self.lines-self.count()
     
     def count(self):
-    """Returns the number of played moves"""
-        return sum(map(int,self.board))
+        """Returns the number of played moves"""
+        return bin(self.state).count('1')
     
     def order(self):
-    """Returns the order which the moves were played. Will on display correctly when the game is played from start to finish without using .read_board()"""
-        return self.orderofmoves
+        """Returns the order which the moves were played. Will on display correctly when the game is played from start to finish without using .read_board()"""
+        return self.moves[:self.played]
    
     def score(self):
-    """Computes the score of a given position"""
-        s = 0
-        
-        for i in self.topstick_indices():
-            
-            if self.board[i] == '1' and self.board[i+self.c] =='1'             and self.board[i+self.c+1] == '1' and self.board[i+(2*self.c)+1] == '1':
-                    
-                s += 1
-                        
-        return s
+        """Computes the score of a given position"""
+        return self.boxes
 
     def legal_moves(self):
-    """Returns a list with the index of all possible moves yet to be played"""
-        legalmoves = []
-        
-        for i in range(len(self.board)):
-            if self.board[i] == '0':
-                legalmoves.append(i)
-            else:
-                pass
-        return legalmoves    
+        """Returns a list with the index of all possible moves yet to be played, in increasing order.  Boards of up
+        to 24 edges need two table lookups, larger ones one per 12 edges"""
+        state = self.state
+        if self.lines <= 24:
+            return [*self.high_moves[state >> 12], *self.low_moves[state & 4095]]
+        legal = []
+        for shift, moves in self.geometry.free_moves:
+            legal += moves[(state >> shift) & 4095]
+        return legal
  
     def score_player_one(self):
-    """Returns player one's score, only work when the whole game has been played without using .read_board()"""
+        """Returns player one's score, only work when the whole game has been played without using .read_board()"""
         return self.score1
     
     def score_player_two(self):
-    """Returns player two's score, only work when the whole game has been played without using .read_board()"""
+        """Returns player two's score, only work when the whole game has been played without using .read_board()"""
         return self.score2
 
     def topstick_indices(self):
-    """Used to produce the GUI"""
-        indices = []
-        
-        for i in range(self.r):
-            for j in range(self.c):
-                topstick = (i*(2*self.c + 1)) + j
-                indices.append(topstick)
-                
-        return indices
+        """Used to produce the GUI"""
+        return list(self.geometry.top_edges)
     
     def horizontal(self):
-    """Used to produce the GUI"""
-        indices = []
-        
-        for i in range(self.r+1):
-            for j in range(self.c):
-                topstick = (i*(2*self.c + 1)) + j
-                indices.append(topstick)
-                
-        return indices
+        """Used to produce the GUI"""
+        return list(self.geometry.horizontal_edges)
     
     def lastinrow(self):
-    """Used to produce the GUI"""
-        indices = []
-        value = -1
-        
-        for i in range(2*self.r+1):
-                if i%2 == 0:
-                    value += self.c
-                    indices.append(value)
-                else:
-                    value += self.c+1
-                    indices.append(value)
-        
-        return indices
+        """Used to produce the GUI"""
+        return list(self.geometry.row_ends)
     
     def horizontal_flip(self):
-    """Produces a list of the index positions of the moves reordered after a horizontal flip of the board"""
-        H = []
-        x = self.c - 1
-        while True:
-            for i in range(self.c):
-                H.append(x)
-                x-=1
-                
-            if len(H) == self.lines:
-                return H
-                
-            x += 2*self.c + 1
-            
-            for i in range(self.c+1):
-                H.append(x)
-                x -= 1
-                
-            x += 2*self.c + 1
+        """Produces a list of the index positions of the moves reordered after a horizontal flip of the board"""
+        return list(self.geometry.symmetries['horizontal_flip'])
       
     def vertical_flip(self):
-    """Produces a list of the index positions of the moves reordered after a vertical flip of the board"""
-        V = []
-        x = self.lines - self.c
-        
-        while True:
-            y = x
-            for i in range(self.c):
-                V.append(y)
-                y += 1
-                
-            x -= self.c + 1
-            y = x
-            
-            if len(V) == self.lines:
-                return V
-                
-            for i in range(self.c+1):
-                V.append(y)
-                y += 1
-            
-            x -= self.c
+        """Produces a list of the index positions of the moves reordered after a vertical flip of the board"""
+        return list(self.geometry.symmetries['vertical_flip'])
       
     def rotate(self):
-     """Produces a list of the index positions of the moves reordered after a rotation of the board"""
-        R = []
-        x = self.lines - 2*self.c - 1
-        y = self.lines - self.c
-        
-        while True:
-            a = x
-            for i in range(self.c):
-                R.append(a)
-                a -= 2*self.c + 1
-        
-            x += 1
-            
-            if len(R) == self.lines:
-                return R
-            
-            b = y
-            for i in range(self.c+1):
-                R.append(b)
-                b -= 2*self.c + 1 
-                
-            y +=1
+        """Produces a list of the index positions of the moves reordered after a rotation of the board"""
+        return list(self.geometry.symmetries['rotate'])
      
     def nothing(self):
-    """Used to produce a list with the original index positions of the board"""
-        N = []
-        for i in range(self.lines):
-            N.append(i)
-            
-        return N
+        """Used to produce a list with the original index positions of the board"""
+        return list(self.geometry.symmetries['nothing'])
      
     def combine(self, original, order):
-    """Used to combine two symmetries together"""
+        """Used to combine two symmetries together"""
         return [original[i] for i in order]
   
     def GUI(self):
-    """Used to print the board in a more comprehensible fashion, the turn and score counters work best when the entire game was played with read.board()"""
-        graph = ''
-        
-        for i in range(len(self.board)):
-            if i in self.horizontal():
-                if i in self.lastinrow():
-                    if self.board[i] == '1':
-                        graph += '+---+\n'
-                    else:
-                        graph += '+   +\n'
-                else:
-                    if self.board[i] == '1':
-                        graph += '+---'
-                    else:
-                        graph += '+   '
-            else: 
-                if i in self.lastinrow():
-                    if self.board[i] == '1':
-                        graph += '|\n'
-                    else:
-                        graph += ' \n'
-                else:
-                    if self.board[i] == '1':
-                        graph += '|   '
-                    else:
-                        graph += '    '
-                        
+        """Used to print the board in a more comprehensible fashion, the turn and score counters work best when the entire game was played with read.board()"""
+        graph = self.geometry.render(self.state)
         graph += 'Turn: '+ str(self.whose_turn())
-        graph += '\nScore Player 1: ' + str(self.player1())
-        graph += '\nScore Player 2: ' + str(self.player2()) + '\n'
+        graph += '\nScore Player 1: ' + str(self.score1)
+        graph += '\nScore Player 2: ' + str(self.score2) + '\n'
         
         return (graph)
@@ -0,0 +1,288 @@
+import DotsBoard as Dots
+from functools import lru_cache
+
+CHAIN, LOOP = 'chain', 'loop'
+
+@lru_cache(maxsize=None)
+def closed_value(chains, loops):
+    """
+    Returns the value, for the player to move, of an endgame made only of
+    unopened chains and loops (sorted tuples of their lengths) where every move
+    opens one of them.  The opponent replies to an opened chain of length L by
+    taking all of it and moving next, or by taking all but two and leaving them
+    so that the opener has to move next (L - 4); for a loop the handout costs
+    four boxes (L - 8).  Chains shorter than three are simply taken, since a
+    chain of two is opened in the middle where it can not be declined.
+    """
+    best = None
+
+    for kind, lengths in ((CHAIN, chains), (LOOP, loops)):
+        for length in set(lengths):
+            rest = list(lengths)
+            rest.remove(length)
+            rest = tuple(rest)
+            v = closed_value(rest, loops) if kind == CHAIN else closed_value(chains, rest)
+            reply = best_reply(kind, length, v)
+            if best is None or -reply > best:
+                best = -reply
+
+    return 0 if best is None else best
+
+def best_reply(kind, length, v):
+    """Returns the value of the best reply to the opening of a chain or loop of that length, where v is the value of
+    the rest of the endgame for whoever has to move in it"""
+    if kind == LOOP:
+        return max(length + v, length - 8 - v)
+    if length >= 3:
+        return max(length + v, length - 4 - v)
+    return length + v
+
+
+class Component:
+    """
+    A chain or loop of boxes that each have at most two undrawn sides.
+    my_component.boxes lists the boxes in path order
+    my_component.edges lists the undrawn edges along the path: for a chain
+      the edge before the first box, the edges linking consecutive boxes and
+      the edge after the last box, with None where the chain ends in a box that
+      is ready to be taken (a dead end); for a loop the edge after each box
+    my_component.dead_ends counts those dead ends: an unopened chain has
+      none, a chain that was opened at one end has one and an opened loop two
+    """
+
+    def __init__ ( self, kind, boxes, edges ):
+        self.kind = kind
+        self.boxes = boxes
+        self.edges = edges
+        self.dead_ends = 0 if kind == LOOP else (edges[0] is None) + (edges[-1] is None)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __repr__(self):
+        opened = f', {self.dead_ends} dead' if self.dead_ends else ''
+        return f'{self.kind}({len(self)}{opened})'
+
+    def opened(self):
+        """True if some box of the component can be taken right away"""
+        return self.dead_ends > 0
+
+    def capture(self):
+        """Returns an edge taking a box at a dead end"""
+        return self.edges[1] if self.edges[0] is None else self.edges[-2]
+
+    def decline(self):
+        """Returns the edge that hands the last boxes over when declining, or None if it is too early for that"""
+        if self.dead_ends == 1 and len(self) == 2:
+            return self.edges[-1] if self.edges[0] is None else self.edges[0]
+        if self.dead_ends == 2 and len(self) == 4:
+            return self.edges[2]
+        return None
+
+    def opening(self):
+        """Returns the edge to play when opening the component: the middle of a chain of two, so that the
+        opponent can not decline it, and an end of anything else"""
+        if self.kind == CHAIN and len(self) == 2:
+            return self.edges[1]
+        return self.edges[0]
+
+
+class ChainAnalyzer:
+    """
+    Splits positions of an nxm board into chains and loops using the edge to
+    box adjacency of DotsBoard.  Boxes with three or four undrawn sides are
+    junctions that end chains like the border of the board does; once there
+    are none left the position is a simple endgame and its exact value and an
+    optimal move follow from the chain and loop lengths.  Example:
+    my_analyzer = ChainAnalyzer(3, 3)
+    position = my_analyzer.analyze(board) takes a binary string, an integer or
+      a DotsBoard instance
+    position.components is the list of chains and loops
+    position.value() is the best box difference the player to move can reach
+      from here, or None before the endgame
+    position.optimal_move() is a move reaching it
+    position.play(move) updates the decomposition for one more edge
+    """
+
+    def __init__ ( self, n, m ):
+        shape = Dots.geometry(n,m)
+        self.n = n
+        self.m = m
+        self.lines = shape.lines
+        self.edge_bits = shape.edge_bits
+        self.box_edges = list(shape.box_edges)
+        self.edge_boxes = [ list(boxes) for boxes in shape.edge_box_indices ]
+
+    def analyze(self, board):
+        """Returns the Position of the given board"""
+        return Position(self, Dots.state_id(board))
+
+
+class Position:
+    """The chains and loops of one position, kept up to date as edges are played (see ChainAnalyzer)"""
+
+    def __init__ ( self, analyzer, state ):
+        self.analyzer = analyzer
+        self.state = state
+        self.free = [ sum(1 for e in edges if not state & analyzer.edge_bits[e]) for edges in analyzer.box_edges ]
+        self.component_of = [None] * len(self.free)
+        self.components = []
+        self.trace(range(len(self.free)))
+
+    def free_edges(self, box):
+        """Returns the undrawn sides of a box"""
+        return [ e for e in self.analyzer.box_edges[box] if not self.state & self.analyzer.edge_bits[e] ]
+
+    def across(self, box, edge):
+        """Returns the box on the other side of an edge, or None for the border of the board and for junctions"""
+        for other in self.analyzer.edge_boxes[edge]:
+            if other != box:
+                return other if self.free[other] <= 2 else None
+        return None
+
+    def walk(self, start, edge):
+        """Follows the path leaving start through edge.  Returns the boxes passed, the last edge crossed (None at a
+        dead end) and whether the path came back to start"""
+        boxes = []
+        box = start
+        while True:
+            following = self.across(box, edge)
+            if following is None:
+                return boxes, edge, False
+            if following == start:
+                return boxes, edge, True
+            boxes.append(following)
+            sides = self.free_edges(following)
+            if len(sides) == 1:
+                return boxes, None, False
+            edge = sides[1] if sides[0] == edge else sides[0]
+            box = following
+
+    def component(self, start):
+        """Traces the chain or loop containing start, a box with one or two undrawn sides"""
+        sides = self.free_edges(start)
+        boxes, end, closed = self.walk(start, sides[0])
+
+        if closed:
+            loop = [start] + boxes
+            return Component(LOOP, loop, self.loop_edges(loop))
+        if len(sides) == 1:
+            return Component(CHAIN, [start] + boxes, [None] + self.path_edges([start] + boxes) + [end])
+
+        back, back_end, closed = self.walk(start, sides[1])
+        path = back[::-1] + [start] + boxes
+        return Component(CHAIN, path, [back_end] + self.path_edges(path) + [end])
+
+    def link(self, box, other):
+        """Returns the undrawn edge shared by two boxes"""
+        for e in self.analyzer.box_edges[box]:
+            if other in self.analyzer.edge_boxes[e] and not self.state & self.analyzer.edge_bits[e]:
+                return e
+
+    def path_edges(self, path):
+        """Returns the edges linking consecutive boxes of a path"""
+        return [ self.link(a, b) for a, b in zip(path, path[1:]) ]
+
+    def loop_edges(self, loop):
+        """Returns the edge after each box of a loop"""
+        return self.path_edges(loop + loop[:1])
+
+    def trace(self, boxes):
+        """Adds the components containing the given boxes that are not part of one yet"""
+        for box in boxes:
+            if self.component_of[box] is None and 1 <= self.free[box] <= 2:
+                component = self.component(box)
+                for b in component.boxes:
+                    self.component_of[b] = component
+                self.components.append(component)
+
+    def play(self, move):
+        """Draws one more edge, retracing only the components around it.  Returns the number of boxes completed"""
+        bit = self.analyzer.edge_bits[move]
+        if self.state & bit:
+            return 0
+
+        touched = set()
+        for box in self.analyzer.edge_boxes[move]:
+            touched.add(box)
+            if self.free[box] >= 3:
+                for e in self.free_edges(box):
+                    touched.update(self.analyzer.edge_boxes[e])
+
+        stale = { self.component_of[box] for box in touched } - {None}
+        for component in stale:
+            self.components.remove(component)
+            for box in component.boxes:
+                self.component_of[box] = None
+            touched.update(component.boxes)
+
+        self.state |= bit
+        completed = 0
+        for box in self.analyzer.edge_boxes[move]:
+            self.free[box] -= 1
+            completed += self.free[box] == 0
+
+        self.trace(sorted(touched))
+        return completed
+
+    def chains(self):
+        """Returns the lengths of the chains, opened or not"""
+        return [ len(c) for c in self.components if c.kind == CHAIN ]
+
+    def loops(self):
+        """Returns the lengths of the unopened loops"""
+        return [ len(c) for c in self.components if c.kind == LOOP ]
+
+    def is_endgame(self):
+        """True once no box has more than two undrawn sides"""
+        return max(self.free, default=0) <= 2
+
+    def options(self):
+        """Returns the value of the position and the move reaching it, or (None, None) before the endgame"""
+        if not self.is_endgame():
+            return None, None
+
+        opened = [ c for c in self.components if c.opened() ]
+        closed = [ c for c in self.components if not c.opened() ]
+        chains = tuple(sorted(len(c) for c in closed if c.kind == CHAIN))
+        loops = tuple(sorted(len(c) for c in closed if c.kind == LOOP))
+
+        if not opened:
+            if not closed:
+                return 0, None
+            best_value, best = None, None
+            for c in closed:
+                rest_chains, rest_loops = list(chains), list(loops)
+                (rest_chains if c.kind == CHAIN else rest_loops).remove(len(c))
+                v = closed_value(tuple(rest_chains), tuple(rest_loops))
+                value = -best_reply(c.kind, len(c), v)
+                if best_value is None or value > best_value:
+                    best_value, best = value, c
+            return best_value, best.opening()
+
+        total = sum(len(c) for c in opened)
+        v = closed_value(chains, loops)
+        best_value, keep = total + v, None
+        for c in opened:
+            if c.dead_ends == 1 and len(c) >= 2:
+                value = total - 4 - v
+            elif c.dead_ends == 2 and len(c) >= 4:
+                value = total - 8 - v
+            else:
+                continue
+            if value > best_value:
+                best_value, keep = value, c
+
+        others = [ c for c in opened if c is not keep ]
+        if others:
+            return best_value, others[0].capture()
+        move = keep.decline()
+        return best_value, keep.capture() if move is None else move
+
+    def value(self):
+        """Returns the best box difference the player to move can reach from here, or None before the endgame"""
+        return self.options()[0]
+
+    def optimal_move(self):
+        """Returns a move reaching value(), or None before the endgame or once the game is over"""
+        return self.options()[1]
@@ -0,0 +1,127 @@
+from DotsSimulator import BatchSimulator, TablePolicy
+from DotsQTable import QTable
+import DotsPlayer
+import numpy as np
+
+Z = 1.959963984540054
+
+class MovePolicy:
+    """A policy for BatchSimulator that asks a player with a best_move(state) method, such as a SearchPlayer, for one
+    move at a time"""
+
+    def __init__ ( self, player ):
+        self.player = player
+
+    def __call__(self, states, legal):
+        return np.array([ self.player.best_move(int(state)) for state in states ], dtype=np.intp)
+
+
+class TFPolicy:
+    """
+    A policy for BatchSimulator that plays a tf-agents policy the way the
+    notebook's Dots_Env does: the board is the observation and the action picks
+    among the legal moves modulo their number.  All the games to move are
+    handed to the policy as one batched time step.
+    """
+
+    def __init__ ( self, policy ):
+        self.policy = policy
+
+    def __call__(self, states, legal):
+        import tensorflow as tf
+        from tf_agents.trajectories import time_step as ts
+
+        lines = legal.shape[1]
+        shifts = lines - 1 - np.arange(lines, dtype=np.int64)
+        observation = ((np.asarray(states)[:, None] >> shifts) & 1).astype(np.int32)
+        count = len(observation)
+        time_step = ts.TimeStep(tf.fill([count], ts.StepType.MID), tf.zeros([count], tf.float32),
+                                tf.ones([count], tf.float32), tf.constant(observation))
+
+        actions = np.asarray(self.policy.action(time_step).action).astype(np.int64).reshape(count)
+        choice = actions % np.maximum(legal.sum(axis=1), 1)
+        return (legal.cumsum(axis=1) > choice[:, None]).argmax(axis=1)
+
+
+def player_policy(player, seed=None):
+    """Returns a BatchSimulator policy for a DotsPlayer, played greedily from its Q-table, or for any other player
+    with a best_move(state) method"""
+    if isinstance(getattr(player, 'table', None), QTable):
+        return TablePolicy(player.table, seed)
+    return MovePolicy(player)
+
+def exact_policy(n, m, seed=None):
+    """Returns a BatchSimulator policy playing perfectly from solved Q-values (see DotsSolver).  The values are kept in
+    a canonical table, which still needs the full state space to solve, so this is for small boards"""
+    player = DotsPlayer.DotsPlayer(n, m, canonical=True)
+    player.solve()
+    return TablePolicy(player.table, seed)
+
+def rate_interval(successes, trials):
+    """Returns the 95% Wilson score interval of a rate"""
+    if trials == 0:
+        return (0.0, 1.0)
+    p = successes / trials
+    centre = (p + Z**2 / (2*trials)) / (1 + Z**2 / trials)
+    half = Z * np.sqrt(p*(1 - p) / trials + Z**2 / (4*trials**2)) / (1 + Z**2 / trials)
+    return (float(centre - half), float(centre + half))
+
+def mean_interval(values):
+    """Returns the mean of a sample and its 95% normal confidence interval"""
+    mean = float(np.mean(values))
+    half = Z * float(np.std(values, ddof=1)) / np.sqrt(len(values)) if len(values) > 1 else 0.0
+    return mean, (float(mean - half), float(mean + half))
+
+def evaluate(n, m, agent, opponent=None, num_games=1000, seed=None, seats='alternate'):
+    """
+    Plays num_games nxm games of agent against opponent all at once on a
+    BatchSimulator and summarises the agent's results.  agent and opponent are
+    BatchSimulator policies (see player_policy, exact_policy and TFPolicy);
+    None plays random moves.  seats='first' or 'second' fixes the agent's seat,
+    'alternate' gives it the first move in half of the games.
+    With a seed every simulator and table policy draws from its own stream
+    derived from it, so the same seed gives the same games; this replaces
+    the generator of every TablePolicy passed in, whatever seed it was built
+    with.
+    Returns a dict with the mean return (boxes taken by the agent) and the
+    win, draw and loss rates, each with its 95% confidence interval, and the
+    mean box margin.
+    """
+    if seats == 'first':
+        counts = (num_games, 0)
+    elif seats == 'second':
+        counts = (0, num_games)
+    elif seats == 'alternate':
+        counts = (num_games - num_games // 2, num_games // 2)
+    else:
+        raise ValueError("seats must be 'first', 'second' or 'alternate'")
+
+    streams = np.random.SeedSequence(seed).spawn(4)
+    for policy, stream in zip((agent, opponent), streams[2:]):
+        if seed is not None and isinstance(policy, TablePolicy):
+            policy.rng = np.random.default_rng(stream)
+
+    returns, margins = [], []
+    for seat, (count, stream) in enumerate(zip(counts, streams[:2])):
+        if count == 0:
+            continue
+        sim = BatchSimulator(n, m, count, seed=stream)
+        scores = sim.rollout((agent, opponent) if seat == 0 else (opponent, agent)).astype(np.int32)
+        returns.append(scores[:, seat])
+        margins.append(scores[:, seat] - scores[:, 1 - seat])
+
+    returns = np.concatenate(returns)
+    margins = np.concatenate(margins)
+    wins, draws, losses = int((margins > 0).sum()), int((margins == 0).sum()), int((margins < 0).sum())
+    mean_return, return_interval = mean_interval(returns)
+
+    return { 'games': num_games,
+             'mean_return': mean_return,
+             'return_interval': return_interval,
+             'mean_margin': float(margins.mean()),
+             'win_rate': wins / num_games,
+             'win_interval': rate_interval(wins, num_games),
+             'draw_rate': draws / num_games,
+             'draw_interval': rate_interval(draws, num_games),
+             'loss_rate': losses / num_games,
+             'loss_interval': rate_interval(losses, num_games) }
@@ -0,0 +1,222 @@
+from contextlib import contextmanager, nullcontext
+import collections
+import csv
+import logging
+import os
+import sys
+import threading
+import time
+
+class Instrumentation:
+    """
+    Collects per-phase timers and counters from a DotsPlayer while it trains
+    and hands them to pluggable sinks.  Example:
+    my_player.instrumentation = Instrumentation([MemorySink(), CSVSink('t.csv')])
+    with instrumentation.phase('update'): ... adds the time spent to 'update'
+    instrumentation.count('updates_applied', 1000) adds to a counter
+    instrumentation.flush('batch') sends everything collected since the last
+      flush to the sinks and starts over
+    With profile=True a SamplingProfiler runs between start() and stop() (or
+    inside a with block) and its hottest lines are flushed along with the rest.
+    """
+
+    enabled = True
+
+    def __init__ ( self, sinks=(), profile=False, interval=0.001 ):
+        self.sinks = list(sinks)
+        self.timers = {}
+        self.counters = {}
+        self.profiler = SamplingProfiler(interval) if profile else None
+
+    @contextmanager
+    def phase(self, name):
+        """Times the body of a with block as one call of the named phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        """Adds seconds measured elsewhere, such as in a worker process, to the named phase"""
+        total, count = self.timers.get(name, (0.0, 0))
+        self.timers[name] = (total + seconds, count + calls)
+
+    def count(self, name, amount=1):
+        """Adds amount to the named counter"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def records(self, label=None):
+        """Returns everything collected since the last flush as a list of dicts with the keys time, label, kind
+        ('timer', 'counter' or 'profile'), name, value and calls"""
+        now = time.time()
+        records = [ { 'time': now, 'label': label, 'kind': 'timer', 'name': name, 'value': total, 'calls': calls }
+                    for name, (total, calls) in self.timers.items() ]
+        records += [ { 'time': now, 'label': label, 'kind': 'counter', 'name': name, 'value': value, 'calls': None }
+                     for name, value in self.counters.items() ]
+        if self.profiler is not None:
+            records += [ { 'time': now, 'label': label, 'kind': 'profile', 'name': location, 'value': fraction, 'calls': samples }
+                         for location, samples, fraction in self.profiler.top() ]
+        return records
+
+    def flush(self, label=None):
+        """Sends the records collected since the last flush to every sink and clears them"""
+        records = self.records(label)
+        for sink in self.sinks:
+            sink.emit(records)
+        self.reset()
+        return records
+
+    def reset(self):
+        """Clears the timers, counters and profile samples"""
+        self.timers = {}
+        self.counters = {}
+        if self.profiler is not None:
+            self.profiler.reset()
+
+    def start(self):
+        """Starts the sampling profiler, if there is one"""
+        if self.profiler is not None:
+            self.profiler.start()
+        return self
+
+    def stop(self):
+        """Stops the sampling profiler, if there is one"""
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class NullInstrumentation:
+    """The instrumentation used when none is installed.  Every method does nothing, and phase() returns one shared
+    no-op context manager, so leaving the hooks in the training loops costs next to nothing"""
+
+    enabled = False
+    no_phase = nullcontext()
+
+    def phase(self, name):
+        return self.no_phase
+
+    def add_time(self, name, seconds, calls=1):
+        pass
+
+    def count(self, name, amount=1):
+        pass
+
+    def records(self, label=None):
+        return []
+
+    def flush(self, label=None):
+        return []
+
+    def reset(self):
+        pass
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread (the one that created the profiler by
+    default) from a background thread every interval seconds and counts the
+    line each sample is on.  Work done in pool worker processes is not seen.
+    """
+
+    def __init__ ( self, interval=0.001, thread_id=None ):
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.samples = collections.Counter()
+        self.running = threading.Event()
+        self.thread = None
+
+    def run(self):
+        while self.running.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                code = frame.f_code
+                self.samples[f'{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}'] += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        if self.thread is None:
+            self.running.set()
+            self.thread = threading.Thread(target=self.run, name='SamplingProfiler', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.running.clear()
+            self.thread.join()
+            self.thread = None
+
+    def reset(self):
+        self.samples = collections.Counter()
+
+    def top(self, count=20):
+        """Returns the count most sampled lines as (location, samples, fraction of all samples)"""
+        total = sum(self.samples.values())
+        return [ (location, samples, samples / total) for location, samples in self.samples.most_common(count) ]
+
+
+class MemorySink:
+    """Keeps every record in self.records"""
+
+    def __init__ ( self ):
+        self.records = []
+
+    def emit(self, records):
+        self.records.extend(records)
+
+    def totals(self, kind='timer'):
+        """Returns the values of one kind of record summed by name"""
+        totals = collections.defaultdict(float)
+        for record in self.records:
+            if record['kind'] == kind:
+                totals[record['name']] += record['value']
+        return dict(totals)
+
+
+class LogSink:
+    """Writes every record as one line to a logging.Logger"""
+
+    def __init__ ( self, logger=None, level=logging.INFO ):
+        self.logger = logger if logger is not None else logging.getLogger('dots.instrument')
+        self.level = level
+
+    def emit(self, records):
+        for record in records:
+            calls = '' if record['calls'] is None else f" ({record['calls']} calls)"
+            self.logger.log(self.level, '%s %s %s = %.6g%s', record['label'] or '-', record['kind'], record['name'],
+                            record['value'], calls)
+
+
+class CSVSink:
+    """Appends every record as one row of a CSV file, writing the header when the file is new"""
+
+    fields = ('time', 'label', 'kind', 'name', 'value', 'calls')
+
+    def __init__ ( self, path ):
+        self.path = path
+
+    def emit(self, records):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.fields)
+            if new:
+                writer.writeheader()
+            writer.writerows(records)
@@ -1,47 +1,121 @@
 import DotsBoard as Dots
+from DotsQTable import QTable, CanonicalQTable, LazyQTable, symmetry_tables, symmetry_images, save_table, load_table
+from DotsShared import SharedTable, collect_experiences
+from DotsSolver import solve, compare
+from DotsSimulator import BatchSimulator
+from DotsInstrument import NullInstrumentation
+from DotsRecord import read_experiences
+from multiprocessing.shared_memory import SharedMemory
 import random
-import itertools
-import pandas as pd
+import heapq
 import numpy as np
 import time
 from pathos.pools import ProcessPool
 import pathos as pa
 import os
 
+class ConvergenceTracker:
+    """
+    Keeps track of how much the Q-table changes while updates are applied, so
+    that deciding whether training has converged costs as much as the batch
+    instead of a comparison of two full copies of the table.
+    my_tracker.trace holds the largest absolute change of every finished batch
+    my_tracker.converged() is True once the last `window` batches all stayed
+      within `tolerance`
+    my_tracker.changes[row], when rows is given, counts the updates that moved
+      an entry of that table row by more than `tolerance`; it grows with a
+      LazyQTable, so it can be longer than the table
+    """
+
+    def __init__ ( self, tolerance=0.001, window=1, rows=None ):
+        self.tolerance = tolerance
+        self.window = window
+        self.trace = []
+        self.batch_max = 0.0
+        self.changes = None if rows is None else np.zeros(rows, dtype=np.int32)
+
+    def record(self, delta, row):
+        """Records the absolute change made by one update to the given table row"""
+        if delta > self.batch_max:
+            self.batch_max = delta
+        if self.changes is not None and delta > self.tolerance:
+            if row >= len(self.changes):
+                self.grow(row + 1)
+            self.changes[row] += 1
+
+    def record_batch(self, deltas, rows):
+        """Records the absolute changes made by a batch of updates to the given table rows"""
+        if len(deltas) > 0:
+            self.batch_max = max(self.batch_max, float(deltas.max()))
+        if self.changes is not None:
+            rows = rows[deltas > self.tolerance]
+            if len(rows) and rows.max() >= len(self.changes):
+                self.grow(int(rows.max()) + 1)
+            np.add.at(self.changes, rows, 1)
+
+    def grow(self, rows):
+        """Makes room in .changes for at least rows rows, at least doubling it, as a LazyQTable gains rows"""
+        changes = np.zeros(max(rows, 2 * len(self.changes)), dtype=np.int32)
+        changes[:len(self.changes)] = self.changes
+        self.changes = changes
+
+    def end_batch(self):
+        """Closes the current batch, adding its largest change to the trace, and returns that change"""
+        self.trace.append(self.batch_max)
+        self.batch_max = 0.0
+        return self.trace[-1]
+
+    def converged(self):
+        """Returns True once the last `window` batches all changed the table by at most `tolerance`"""
+        recent = self.trace[-self.window:]
+        return len(recent) == self.window and max(recent) <= self.tolerance
+
+
 class DotsPlayer:
     """
     A player will play a dots and boxes game (that is, an instance of the Dots
     class you've already built) and learn from it (using a Q-table).
-    The format of the Q-table is a pandas DataFrame whose row index is all game
-    states and whose column index is all legal moves; the entries in the table
-    are the best predictions (learned so far) of long-term reward for that move
-    from that state.  Example:
-    my_player.q_table.index is a pd.Series containing all board states; for a
-      1x2 game this is something like "0000000", "0000001", "0000010",
-      "0000011", and so on...
-    my_player.q_table.columns contains the list of legal moves from a blank
-      board, which in the 1x2 case is 0,1,2,3,4,5,6
-    my_player.q_table.loc["0011010",3] is the value (as best as the player has
-      learned it so far) of making move 3 when in state "0011010"
+    The Q-table is a float32 ndarray whose row index is the integer encoding of
+    a game state and whose column index is all legal moves; the entries in the
+    table are the best predictions (learned so far) of long-term reward for that
+    move from that state.  Example:
+    a 1x2 board such as "0011010" is stored in row int("0011010", 2) == 26
+    my_player.qtable[26, 3] is the value (as best as the player has learned it
+      so far) of making move 3 when in state "0011010"
+    my_player.qtable_frame() exports the table as a pandas DataFrame indexed by
+      binary strings, for inspection
+    Boards can be passed to the player either as binary strings or as integers.
+    my_player.instrumentation, an Instrumentation from DotsInstrument, times
+      the phases of the training loops and counts their work when installed
     """
 
-    def __init__ ( self, n, m ):
+    def __init__ ( self, n, m, canonical=False, table=None, lazy=False ):
         """
         Set up a new player capable of playing nxm Dots-and-Boxes games.  Make
         an empty Q-table with the appropriate set of row and column headings.
         Also initialize the alpha and gamma values to be used in the Bell
-        equation when learning.
+        equation when learning.  With canonical=True the Q-table only stores
+        one row per class of symmetric boards (see CanonicalQTable).  With
+        lazy=True rows are only made for the states training reaches (see
+        LazyQTable), so nothing is built up front and larger boards such as 3x3
+        can start training at once.  An existing table, such as one loaded from
+        a checkpoint, can be passed in instead of building a new one.
         """
+        if canonical and lazy:
+            raise ValueError('a table cannot be both canonical and lazy')
+
         self.count = 0
         a = Dots.DotsBoard(n,m)
         self.n = n
         self.m = m
         self.num_cores = pa.helpers.cpu_count()
-        self.pool = ProcessPool( nodes=self.num_cores )
+        self.workers = None
+        self.shared = None
+        self.tracker = None
+        self.instrumentation = NullInstrumentation()
         
-        self.legal_boards = []
-        for i in range((2**len(a.board))-1):
-            self.legal_boards.append(format(i, "b").zfill(len(a.board)))
+        self.edge_bits = a.edge_bits
+        self.lines = a.lines
 
         if self.n == self.m:
             self.N = a.nothing()
@@ -59,46 +133,123 @@ class DotsPlayer:
             self.V = a.vertical_flip()
             self.HV = a.combine(self.H,self.V)
             self.symmetries = [self.N,self.H,self.V,self.HV]
+
+        self.perms = np.array(self.symmetries, dtype=np.intp)
+        self.inverse_perms = np.argsort(self.perms, axis=1)
+        self.sym_tables = symmetry_tables(self.perms, self.lines)
+        self.sym_lists = self.sym_tables.tolist()
+        self.inverse_lists = self.inverse_perms.tolist()
         
-        self.row_index = []
-        for i in itertools.product(['0','1'],repeat=len(a.board)): 
-            self.row_index.append("".join(i)) 
-            
-        self.column_index = []
-        for i in range(len(a.board)):
-            self.column_index.append(i)
-        
-        self.qtable = pd.DataFrame(index= range(len(self.row_index)), columns=range(len(self.column_index)))
-        self.qtable.columns = self.column_index 
-        self.qtable.index = self.row_index
-        self.movetable = self.qtable.copy()
-        self.qtable.loc[:,:] = 0
-
-        for i in self.legal_boards:
-            b = Dots.DotsBoard(n,m)
-            b.get_index_positions(i,'0')
-           
-            for j in b.index_pos_list:
-                b.read_board(i)
-                start_score = b.score()
-                b.play(j)
-                end_score = b.score()
-                self.qtable.loc[i,j] = end_score-start_score
-                self.movetable.loc[i,j] = b.show_board()
-        
-        self.rewards = self.qtable.copy()
+        if table is not None:
+            self.table = table
+        elif canonical:
+            self.table = CanonicalQTable(n,m,self.symmetries)
+            self.table.build()
+        elif lazy:
+            self.table = LazyQTable(n,m)
+        else:
+            self.table = QTable(n,m)
+            self.table.build()
+        self.canonical = isinstance(self.table, CanonicalQTable)
+        self.legal_boards = range(self.table.num_states - 1)
+
         self.alpha = 1
         self.gamma = 1 # or whatever values you want to try
-        
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Creates a player from a checkpoint written by .save().  By default the tables are memory-mapped read-only,
+        which is enough to play; use mmap_mode='c' to keep training without changing the file, or 'r+' to train in
+        place (see load_table).  A lazy table cannot be trained in place, since it grows, so 'r+' reads it into
+        memory and .save() is what keeps its training"""
+        table, header = load_table(path, mmap_mode)
+        player = cls(table.n, table.m, table=table)
+        player.alpha = header['alpha']
+        player.gamma = header['gamma']
+        player.count = header['count']
+        return player
+
+    def save(self, path):
+        """Writes the Q-table, transition table and reward table to a checkpoint file along with the board size, alpha,
+        gamma and the number of experiences trained on"""
+        save_table(self.table, path, self.alpha, self.gamma, self.count)
+
+    def solve(self):
+        """Fills the Q-table with the exact values of every move instead of learning them (see DotsSolver.solve), which
+        turns the player into a perfect one.  Only practical on boards whose table fits in memory"""
+        solve(self.table, self.gamma)
+        return self.qtable
+
+    def compare_to_exact(self, exact=None):
+        """Measures the learned Q-table against the exact values, solving them on a copy of the table unless they are
+        given.  Returns the largest and mean error of the Q-values and the fraction of states where the best move
+        is optimal"""
+        if exact is None:
+            reference = type(self.table).from_arrays(self.n, self.m, { name: getattr(self.table, name) for name in self.table.shared })
+            reference.values = np.zeros_like(self.table.values)
+            exact = solve(reference, self.gamma)
+            if isinstance(self.table, LazyQTable):
+                exact = exact[:len(self.table.values)]
+        return compare(self.table, exact)
+
+    @property
+    def pool(self):
+        """The pathos pool used for multiprocessing, started the first time it is needed"""
+        if self.workers is None:
+            self.workers = ProcessPool( nodes=self.num_cores )
+        return self.workers
+
+    @pool.setter
+    def pool(self, pool):
+        self.workers = pool
+
+    @property
+    def qtable(self):
+        """The Q-values, indexed by [state, move] for a dense table, by [row, column] of the canonical table in
+        canonical mode and by [row, move], where row is table.index[state], for a lazy table"""
+        return self.table.values
+
+    @property
+    def movetable(self):
+        """The state reached by each move, indexed like .qtable"""
+        return self.table.transitions
+
+    @property
+    def rewards(self):
+        """The boxes completed by each move, indexed like .qtable"""
+        return self.table.rewards
+
+    def qtable_frame(self):
+        """Returns the Q-table as a pandas DataFrame indexed by binary board strings, for inspection only"""
+        return self.table.to_frame()
+
+    def legal_moves(self, state):
+        """Returns the moves yet to be played in an integer state"""
+        return [ i for i, bit in enumerate(self.edge_bits) if not state & bit ]
     
+    def symmetric_states(self, state):
+        """Returns the images of an integer state under every symmetry, in the order of self.symmetries"""
+        images = []
+        for tables in self.sym_lists:
+            image = 0
+            for j, table in enumerate(tables):
+                image |= table[(state >> (8*j)) & 255]
+            images.append(image)
+        return images
+
+    def apply_symmetries(self, states, moves):
+        """Applies every symmetry at once to arrays of integer states and moves.  Returns two arrays of shape
+        (len(states), symmetries) holding the transformed states and the matching moves"""
+        return symmetry_images(states, self.sym_tables), self.inverse_perms[:, moves].T
+
     def reorder(self, original, order):
-    """This is used for the use of symmetries to reduce the amount of exploration necessary, combines two lists"""
-         listed = tuple(original)
-         result = [listed[i] for i in order]
-         return ''.join(result)
+        """This is used for the use of symmetries to reduce the amount of exploration necessary, combines two lists"""
+        listed = tuple(original)
+        result = [listed[i] for i in order]
+        return ''.join(result)
     
     def reorder_move(self,move,order):
-    """Orders a move implementing a symmetrical equivalency such as a horizontal flip of the board"""
+        """Orders a move implementing a symmetrical equivalency such as a horizontal flip of the board"""
         return order.index(move)
     
     def best_move ( self, board ):
@@ -110,11 +261,13 @@ class DotsPlayer:
         can return a random one.)  
         """
 
-        legal_moves = [ i for i in range(len(board)) if board[i] == '0' ]
+        state = Dots.state_id(board)
+        legal_moves = self.legal_moves(state)
         
         if len(legal_moves) > 0:
-            best = max( [ self.qtable.loc[board, m] for m in legal_moves ] )
-            options = [ m for m in legal_moves if self.qtable.loc[board,m] == best ]
+            values = self.table.peek(state).tolist()
+            best = max( [ values[m] for m in legal_moves ] )
+            options = [ m for m in legal_moves if values[m] == best ]
             return random.choice( options ) if len( options ) > 0 else None
         else:
             pass
@@ -125,7 +278,7 @@ class DotsPlayer:
         from the legal moves.  This is useful when learning by experimentation.
         """
             
-        legal_moves = [ i for i in range(len(board)) if board[i] == '0' ]
+        legal_moves = self.legal_moves(Dots.state_id(board))
 
         if len(legal_moves) > 0:
             random_num = random.choice(legal_moves)
@@ -133,6 +286,16 @@ class DotsPlayer:
         else:
             pass
  
+    def update_entry(self, state, move, target):
+        """Moves the Q-value of (state, move) towards target by the learning rate alpha, reporting the change to the
+        tracker if one is installed"""
+        q = self.table
+        old_value = q.get(state, move)
+        value = ( 1 - self.alpha ) * old_value + self.alpha * target
+        q.set( state , move , value )
+        if self.tracker is not None:
+            self.tracker.record( abs(value - old_value), q.locate(state, move)[0] )
+
     def learn_from_move ( self, old_state, move, new_state, reward, best_move ):
         """
         This method can be called to tell this player that they were given information
@@ -143,46 +306,143 @@ class DotsPlayer:
         gamma = self.gamma if reward > 0 else -self.gamma
         
         if best_move is not None:
-            self.qtable.loc[ old_state , move ] = ( 1 - self.alpha ) * self.qtable.loc[old_state , move] \
-                + self.alpha * ( reward + gamma * self.qtable.loc[new_state, best_move] )
+            self.update_entry( Dots.state_id(old_state), move, reward + gamma * self.table.get(Dots.state_id(new_state), best_move) )
         else:
-            self.qtable.loc[old_state , move] = ( 1 - self.alpha ) * self.qtable.loc[old_state , move] \
-                + self.alpha * ( reward )
+            self.update_entry( Dots.state_id(old_state), move, reward )
     
     def learn_from_move_symm( self, old_state,move,new_state,reward,best_move):
-    """This method is the same as .learn_from_move() but also adds the associated symmetries in a given board to update the Qtable at all 
-    relevant and related boards"""
+        """This method is the same as .learn_from_move() but also adds the associated symmetries in a given board to update the Qtable at all 
+        relevant and related boards.  In canonical mode most of those boards share one entry, so each distinct entry is
+        updated once"""
         gamma = self.gamma if reward > 0 else -self.gamma
-    
-        if best_move is not None:
-            for order in self.symmetries:
-                old = self.reorder(old_state,order)
-                move_re = self.reorder_move(move,order)
-                self.qtable.loc[ old , move_re ] = \
-                        ( 1 - self.alpha ) * self.qtable.loc[old , move_re] + self.alpha * ( reward + gamma * \
-                        self.qtable.loc[self.reorder(new_state,order), \
-                        self.reorder_move(best_move,order)] )
-        else:
-            for order in self.symmetries:
-                old = self.reorder(old_state,order)
-                move_re = self.reorder_move(move,order)
-                self.qtable.loc[old , move_re] = \
-                        ( 1 - self.alpha ) * self.qtable.loc[old , move_re] \
-                        + self.alpha * (reward)
+        q = self.table
+        olds = self.symmetric_states(Dots.state_id(old_state))
+        news = self.symmetric_states(Dots.state_id(new_state)) if best_move is not None else olds
+        updated = set()
+
+        for old, new, inverse in zip(olds, news, self.inverse_lists):
+            move_re = inverse[move]
+            if self.canonical:
+                cell = q.locate(old, move_re)
+                if cell in updated:
+                    continue
+                updated.add(cell)
+            if best_move is not None:
+                self.update_entry( old, move_re, reward + gamma * q.get(new, inverse[best_move]) )
+            else:
+                self.update_entry( old, move_re, reward )
    
+    def batch_targets(self, old_states, moves, new_states, rewards, best_moves):
+        """Returns the table rows and columns of a batch of experiences (arrays as taken by .learn_from_batch()) and
+        the targets .learn_from_move() would move them towards"""
+        q = self.table
+        old_states = np.asarray(old_states, dtype=np.int64)
+        moves = np.asarray(moves, dtype=np.intp)
+        new_states = np.asarray(new_states, dtype=np.int64)
+        rewards = np.asarray(rewards, dtype=np.float32)
+        best_moves = np.asarray(best_moves, dtype=np.intp)
+
+        rows, columns = q.locate_batch(old_states, moves)
+        has_best = best_moves >= 0
+        new_rows, new_columns = q.locate_batch(new_states, np.where(has_best, best_moves, 0))
+        gamma = np.where(rewards > 0, self.gamma, -self.gamma)
+        return rows, columns, rewards + np.where(has_best, gamma * q.values[new_rows, new_columns], 0)
+
+    def learn_from_batch( self, old_states, moves, new_states, rewards, best_moves, duplicates='last' ):
+        """
+        Applies the update of .learn_from_move() to a whole batch of experiences
+        at once.  The arguments are arrays with one entry per experience, and a
+        best_move of -1 stands for None.  Every target is computed from the
+        Q-table as it was before the batch.  When the same (state, move) pair
+        appears more than once, duplicates='last' keeps the last experience in
+        the batch and duplicates='mean' averages their targets.
+        """
+        with self.instrumentation.phase('update'):
+            self.apply_batch(old_states, moves, new_states, rewards, best_moves, duplicates)
+
+    def apply_batch(self, old_states, moves, new_states, rewards, best_moves, duplicates):
+        """Does the work of .learn_from_batch()"""
+        q = self.table
+        rows, columns, targets = self.batch_targets(old_states, moves, new_states, rewards, best_moves)
+        batch_size = len(targets)
+
+        keys = np.asarray(rows, dtype=np.int64) * self.lines + columns
+        if duplicates == 'last':
+            keys, last = np.unique(keys[::-1], return_index=True)
+            targets = targets[::-1][last]
+        elif duplicates == 'mean':
+            keys, inverse = np.unique(keys, return_inverse=True)
+            targets = np.bincount(inverse, weights=targets) / np.bincount(inverse)
+        else:
+            raise ValueError("duplicates must be 'last' or 'mean'")
+
+        self.instrumentation.count('updates_applied', len(keys))
+        self.instrumentation.count('cells_collapsed', batch_size - len(keys))
+        rows, columns = np.divmod(keys, self.lines)
+        old_values = q.values[rows, columns]
+        values = (( 1 - self.alpha ) * old_values + self.alpha * targets).astype(q.values.dtype)
+        q.values[rows, columns] = values
+        if self.tracker is not None:
+            self.tracker.record_batch(np.abs(values - old_values), rows)
+
+    def experience_arrays(self, games):
+        """Turns a list of experience tuples, as made by .create_experience(), or an experience array, as made by
+        .generate_multiple_experiences(), into the arrays taken by .learn_from_batch()"""
+        if isinstance(games, np.ndarray):
+            return tuple(games.T)
+
+        old_states, moves, new_states, rewards, best_moves = zip(*games)
+        best_moves = [ -1 if b is None else b for b in best_moves ]
+        return np.array(old_states), np.array(moves), np.array(new_states), np.array(rewards), np.array(best_moves)
+
     def generate_multiple_experiences(self, num_games):
-    """This method uses pathos to call the create_experience() method multiple time and take advantage of multiple cores to generate experiences""" 
-        def get_experiences ( x ):
-            return self.create_experience( num_games // self.num_cores )
+        """This method uses pathos to generate num_games experiences on multiple cores.  The Q-table is moved into shared
+        memory the first time, the workers attach to it read-only and write their share of the experiences straight into
+        a shared output array, so only block names are pickled.  Unlike .create_experience(), which keeps a set(), the
+        workers' shares are simply put together, so the same experience can appear more than once.  A LazyQTable that
+        has grown since is shared again.  Returns an int64 array with one (start_state, my_move, new_state, reward,
+        best_move) row per experience, where a best_move of -1 means the game is over"""
+        instrumentation = self.instrumentation
+        if self.shared is not None and self.shared.stale():
+            self.shared.close()
+            self.shared = None
+        if self.shared is None:
+            with instrumentation.phase('share_table'):
+                self.shared = SharedTable(self.table)
+
+        counts = [ num_games // self.num_cores + (1 if i < num_games % self.num_cores else 0) for i in range(self.num_cores) ]
+        starts = np.cumsum([0] + counts[:-1])
+        output = SharedMemory(create=True, size=max(num_games * 5 * 8, 1))
+
+        try:
+            spec = self.shared.spec()
+            tasks = [ (spec, output.name, num_games, start, count, random.getrandbits(32))
+                      for start, count in zip(starts, counts) if count > 0 ]
+            with instrumentation.phase('dispatch'):
+                seconds = self.pool.map( collect_experiences, tasks )
+            instrumentation.add_time('simulate', sum(seconds), len(seconds))
+            with instrumentation.phase('collect'):
+                experiences = np.ndarray((num_games, 5), dtype=np.int64, buffer=output.buf).copy()
+            instrumentation.count('experiences_generated', num_games)
+        finally:
+            output.close()
+            output.unlink()
+
+        return experiences
 
-        sets = self.pool.map( get_experiences, range(self.num_cores) )
-        bigset = [ experience for a_set in sets for experience in a_set ]
-        return bigset
 
+    def simulate_experiences(self, num_games, policies=(None, None)):
+        """Plays num_games whole games at once with a BatchSimulator, randomly unless policies are given (see
+        BatchSimulator.actions), and returns every move played in the layout of .generate_multiple_experiences().
+        Unlike the other generators the start states follow the games instead of being drawn uniformly"""
+        sim = BatchSimulator(self.n, self.m, num_games, seed=random.getrandbits(32))
+        scores, played = sim.rollout(policies, record=True)
+        best_moves = self.table.best_moves(played[:, 2], sim.rng)
+        return np.column_stack([played, best_moves])
 
     def create_experience (self,num_games):
-    """This method generates num_games number of experience to train on wherein an experience is defines as a collection of a start_state
-    my_move, the new_state, a reward, and the best_move from the new_state"""
+        """This method generates num_games number of experience to train on wherein an experience is defines as a collection of a start_state
+        my_move, the new_state, a reward, and the best_move from the new_state"""
         experiences = set()
         
         legal_boards = self.legal_boards
@@ -192,26 +452,28 @@ class DotsPlayer:
             
             my_move = self.random_move(start_state)
             
-            new_state = self.movetable.loc[start_state,my_move]
+            new_state = self.table.transition(start_state,my_move)
             
-            reward = self.rewards.loc[start_state,my_move]
+            reward = self.table.reward(start_state,my_move)
             
             best_move = self.best_move(new_state)
                 
             experiences.add( (start_state,my_move,new_state,reward,best_move) )
 
+        self.instrumentation.count('experiences_generated', num_games)
+        self.instrumentation.count('duplicates_dropped', num_games - len(experiences))
         return experiences
          
     def learn_from_games( self, num_games ):
-    """Generates num_games number of experiences and and calls the .learn_from_move() method to learn from them"""
+        """Generates num_games number of experiences and and calls the .learn_from_move() method to learn from them"""
         for i in range(num_games):
             start_state = random.choice(self.legal_boards)
             
             my_move = self.random_move(start_state)
 
-            new_state = self.movetable.loc[start_state,my_move]
+            new_state = self.table.transition(start_state,my_move)
             
-            reward = self.rewards.loc[start_state,my_move]
+            reward = self.table.reward(start_state,my_move)
             
             best_move = self.best_move(new_state)
 
@@ -226,92 +488,300 @@ class DotsPlayer:
             
             my_move = self.random_move(start_state)
 
-            new_state = self.movetable.loc[start_state,my_move]
+            new_state = self.table.transition(start_state,my_move)
             
-            reward = self.rewards.loc[start_state,my_move]
+            reward = self.table.reward(start_state,my_move)
             
             best_move = self.best_move(new_state)
 
             self.learn_from_move_symm(start_state,my_move,new_state,reward,best_move)
 
     def learn_from_games_mp(self,games):
-    """Calls .learn_from_move() to learn from each experience given"""
-        for arguments in games:
-            self.learn_from_move(*arguments)
+        """Learns from every experience given in one call to .learn_from_batch()"""
+        if len(games) > 0:
+            self.learn_from_batch(*self.experience_arrays(games))
 
     def learn_from_games_mp_symm(self,games):
-    """Same as .learn_from_games_mp() but calls .learn_from_move_symm() instead"""
-        for arguments in games:
-            self.learn_from_move_symm(*arguments)
+        """Same as .learn_from_games_mp() but also learns from the symmetric images of every experience"""
+        if len(games) == 0:
+            return
+
+        old_states, moves, new_states, rewards, best_moves = self.experience_arrays(games)
+        with self.instrumentation.phase('symmetries'):
+            olds, moves = self.apply_symmetries(old_states, moves)
+            news, bests = self.apply_symmetries(new_states, np.maximum(best_moves, 0))
+            bests = np.where(best_moves[:, None] >= 0, bests, -1)
+        self.learn_from_batch(olds.ravel(), moves.ravel(), news.ravel(), np.repeat(rewards, len(self.symmetries)), bests.ravel())
            
-    def is_fully_trained(self):
-    """This function makes a backup of p.qtable, then calls p.learn_from_games(1000),
-    then checks to see if q_table_difference(backup,p.qtable) is very small.
-    If so, it returns True--training didn't make any progress--this guy is fully trained.
-    Otherwise, it returns False--training made progress--this guy is still learning. 
-    At the end of training it returns the number of experiences it used to train"""
-        
-        condition = True
-        diff = 999
-        tolerance = 0.001
+    def learn_from_records(self, path, batch_games=1000, symmetries=False):
+        """Learns from every game in a record file (see DotsRecord) instead of generating experiences, streaming it
+        batch_games games at a time through .learn_from_games_mp(), or .learn_from_games_mp_symm() with
+        symmetries=True, so that archives of any size train in constant memory.  Returns the number of experiences
+        learned from"""
+        learn = self.learn_from_games_mp_symm if symmetries else self.learn_from_games_mp
+        rng = np.random.default_rng(random.getrandbits(32))
+        count = 0
+
+        for experiences in read_experiences(path, self.table, batch_games, rng):
+            learn(experiences)
+            count += len(experiences)
+
+        self.count += count
+        return count
+
+    def state_value(self, state):
+        """Returns the largest Q-value among the legal moves of an integer state, or None once the game is over"""
+        legal_moves = self.legal_moves(state)
+        if len(legal_moves) == 0:
+            return None
+        values = self.table.row(state).tolist()
+        return max( values[m] for m in legal_moves )
+
+    def backup_state(self, state):
+        """Moves the Q-value of every legal move of state towards its target, computed from the values of the states
+        the moves lead to as the movetable and rewards give them.  Returns the largest TD error found"""
+        q = self.table
+        error = 0.0
+
+        for move in self.legal_moves(state):
+            reward = q.reward(state, move)
+            following = self.state_value(state | self.edge_bits[move])
+            if following is None:
+                target = reward
+            else:
+                target = reward + (self.gamma if reward > 0 else -self.gamma) * following
+            error = max(error, abs(target - q.get(state, move)))
+            self.update_entry(state, move, target)
+
+        return error
+
+    def row_values(self, first=0):
+        """Returns the value of the state stored in every row of the Q-table from row first on, the largest Q-value
+        among its legal moves, or 0 once the game is over"""
+        q = self.table
+        states = np.asarray(q.row_states()[first:], dtype=np.int64)
+        legal = (states[:, None] & np.array(self.edge_bits, dtype=np.int64)) == 0
+        values = np.where(legal, q.values[first:], -np.inf).max(axis=1)
+        values[~legal.any(axis=1)] = 0
+        return values
+
+    def bellman_errors(self):
+        """Returns the largest TD error of every row of the Q-table, computed for the whole table at once.  A
+        LazyQTable gains rows for the states its rows lead to"""
+        q = self.table
+        states = np.asarray(q.row_states(), dtype=np.int64)
+        bits = np.array(self.edge_bits, dtype=np.int64)
+        legal = (states[:, None] & bits) == 0
+        values = self.row_values()
+        errors = np.zeros(len(states), dtype=np.float32)
+        chunk = 2**16
+
+        for start in range(0, len(states), chunk):
+            stop = min(start + chunk, len(states))
+            following = states[start:stop, None] | bits
+            rows = q.locate_batch(following, np.zeros_like(following))[0]
+            if len(q.values) > len(values):
+                values = np.concatenate([values, self.row_values(len(values))])
+            rewards = q.rewards[start:stop]
+            targets = rewards + np.where(rewards > 0, self.gamma, -self.gamma) * values[rows]
+            errors[start:stop] = np.where(legal[start:stop], np.abs(targets - q.values[start:stop]), 0).max(axis=1)
+
+        return errors
+
+    def prioritized_sweeping(self, tolerance=0.001, max_backups=None, batch_size=1000):
+        """
+        Learns by prioritized sweeping instead of sampling start states
+        uniformly.  Every state waits in a priority queue keyed by the size of
+        its last TD error, and the state with the largest one is backed up
+        next (see .backup_state()), the one with more edges played on ties so
+        that values settle from the end of the game backwards.  When that
+        changes the value of the state, the states leading to it are queued
+        with the size of the change.  They are found by reversing the
+        movetable: the predecessor of a state through a move is the same state
+        with that edge undrawn.  Stops once no error above tolerance is left,
+        or after max_backups backups, and returns the number of Q-values
+        updated.  If a tracker is installed its batch is closed every
+        batch_size updates.
+        A LazyQTable starts from the states it stores, which must not be none
+        (raises ValueError), and gains rows for the states they lead to and
+        for the predecessors queued, so a long sweep can grow it towards the
+        whole state space.  A row added along the way is queued ahead of the
+        others, since nothing is known about its error yet.
+        """
+        q = self.table
+        if len(q.row_states()) == 0:
+            raise ValueError("the Q-table stores no states to sweep from yet, learn from some games first")
+        priorities = self.bellman_errors()
+        queued = {}
+        heap = []
+        finished = (1 << self.lines) - 1
+
+        def push(state, priority):
+            if state != finished and priority > tolerance and priority > queued.get(state, 0.0):
+                queued[state] = priority
+                heapq.heappush(heap, (-priority, -bin(state).count('1'), state))
+
+        states = q.row_states()
+        for state, priority in zip(states, priorities.tolist()):
+            push(int(state), priority)
+        for state in states[len(priorities):]:
+            push(int(state), float('inf'))
+
+        backups = 0
+        updates = 0
+        while heap and (max_backups is None or backups < max_backups):
+            priority, played, state = heapq.heappop(heap)
+            if queued.get(state) != -priority:
+                continue
+            del queued[state]
+
+            stored = len(q.row_states())
+            before = self.state_value(state)
+            error = self.backup_state(state)
+            change = abs(self.state_value(state) - before)
+            backups += 1
+            updates += len(self.legal_moves(state))
+            if self.tracker is not None and updates >= batch_size * (len(self.tracker.trace) + 1):
+                self.tracker.end_batch()
 
-        while diff > tolerance:
-                table = self.qtable.copy()
+            push(state, (1 - self.alpha) * error)
+            if change > tolerance:
+                for bit in self.edge_bits:
+                    if state & bit:
+                        row = q.locate(state ^ bit, 0)[0]
+                        push(int(q.row_states()[row]), self.gamma * change)
+            for added in q.row_states()[stored:]:
+                push(int(added), float('inf'))
+
+        return updates
+
+    def replay_prioritized(self, experiences, num_batches, batch_size=1000, exponent=0.6, epsilon=0.001):
+        """
+        Learns from num_batches batches drawn from a pool of experiences (as
+        made by .generate_multiple_experiences()) by proportional prioritized
+        replay: an experience is drawn with probability proportional to
+        (|TD error| + epsilon) ** exponent.  The best move of every drawn
+        experience is recomputed from the current Q-table, and the priorities
+        of the whole pool are refreshed after each batch, since one batch moves
+        the targets of other experiences too.  Returns the largest TD error
+        left in the pool; num_batches=0 only measures it.
+        """
+        old_states, moves, new_states, rewards, best_moves = ( np.asarray(a) for a in self.experience_arrays(experiences) )
+        rng = np.random.default_rng(random.getrandbits(32))
+
+        def td_errors():
+            best_moves = self.table.best_moves(new_states, rng)
+            rows, columns, targets = self.batch_targets(old_states, moves, new_states, rewards, best_moves)
+            return best_moves, np.abs(targets - self.table.values[rows, columns])
+
+        best_moves, errors = td_errors()
+        for b in range(num_batches):
+            priorities = (errors + epsilon) ** exponent
+            drawn = rng.choice(len(errors), size=batch_size, p=priorities / priorities.sum())
+            self.learn_from_batch(old_states[drawn], moves[drawn], new_states[drawn], rewards[drawn], best_moves[drawn])
+            self.count += batch_size
+            if self.tracker is not None:
+                self.tracker.end_batch()
+            best_moves, errors = td_errors()
+
+        return float(errors.max())
+
+    def start_tracking(self, tracker):
+        """Installs the ConvergenceTracker used while training, a new one with the default tolerance if None is given"""
+        self.tracker = tracker if tracker is not None else ConvergenceTracker()
+        return self.tracker
+
+    def stop_tracking(self):
+        """Detaches the tracker once training is over, so that later updates are no longer recorded in it"""
+        self.tracker = None
+
+    def is_fully_trained(self, tracker=None, return_trace=False):
+        """This function calls p.learn_from_games(1000) until a batch makes no progress, that is until the largest
+        change it made to the Q-table is very small.  Changes are recorded by a ConvergenceTracker as the updates are
+        applied, so no copy of the table is needed; pass one to change the tolerance, require several quiet batches in
+        a row or count changes per state.  At the end of training it returns the number of experiences it used to
+        train, and with return_trace=True also the largest change of every batch"""
+        tracker = self.start_tracking(tracker)
+
+        while not tracker.converged():
                 self.learn_from_games(1000)
                 self.count += 1000
-                diff = (table - self.qtable).abs().max().max()
+                tracker.end_batch()
 
-        return self.count
+        self.stop_tracking()
+        return (self.count, tracker.trace) if return_trace else self.count
 
-    def is_fully_trained_symm(self):
-    """Same as is_fully_trained() but calls .learn_from_games_symm() instead to take advantage of symmetries"""
-        condition = True
-        diff = 999
-        tolerance = 0.001
+    def is_fully_trained_symm(self, tracker=None, return_trace=False):
+        """Same as is_fully_trained() but calls .learn_from_games_symm() instead to take advantage of symmetries"""
+        tracker = self.start_tracking(tracker)
 
-        while diff > tolerance:
-                table = self.qtable.copy()
+        while not tracker.converged():
                 self.learn_from_games_symm(1000)
                 self.count += 1000
-                diff = (table - self.qtable).abs().max().max()
-                
+                tracker.end_batch()
 
-        return self.count
+        self.stop_tracking()
+        return (self.count, tracker.trace) if return_trace else self.count
 
-    def is_fully_trained_mp(self):
-    """This method generates a batch of experiences to train on and then progressively trains through that batch determining if progress was made or not
-    it operates the same as .is_fully_trained() but takes advantage of multiprocessing"""
-    
-        building_batch_size = 5000
-        learning_batch_size = 1000
-        diff = 999
-        tolerance = 0.001
-
-        while diff > tolerance:
-            to_learn_from = self.generate_multiple_experiences(building_batch_size)
-            while len(to_learn_from) > 0 and diff > tolerance:
-                table = self.qtable.copy()
-                self.learn_from_games_mp(to_learn_from[:learning_batch_size])
-                to_learn_from = to_learn_from[learning_batch_size:]
-                self.count += learning_batch_size
-                diff = (table - self.qtable).abs().max().max()
-
-        return self.count
-
-    def is_fully_trained_mp_symm(self):
-    """The same as is_fully_trained_mp() but calls .learn_from_games_mp_symm() to take advantage of symmetries"""
-        building_batch_size = 5000
+    def is_fully_trained_sweeping(self, tracker=None, return_trace=False):
+        """Trains by .prioritized_sweeping() until no TD error above the tracker's tolerance is left and returns the
+        number of Q-values updated, counted in self.count like experiences are, and with return_trace=True also the
+        largest change of every 1000 updates.  A LazyQTable has to hold some states first"""
+        tracker = self.start_tracking(tracker)
+        self.count += self.prioritized_sweeping(tracker.tolerance)
+        tracker.end_batch()
+
+        self.stop_tracking()
+        return (self.count, tracker.trace) if return_trace else self.count
+
+    def is_fully_trained_prioritized(self, tracker=None, return_trace=False):
+        """Same as is_fully_trained() but replays each pool of 5000 sampled experiences with .replay_prioritized(), in
+        batches of 1000 drawn by TD error, until no error in the pool is above the tracker's tolerance.  Training
+        stops once a freshly sampled pool has no such error to begin with"""
+        pool_size = 5000
         learning_batch_size = 1000
-        diff = 999
-        tolerance = 0.001
-
-        while diff > tolerance:
-            to_learn_from = self.generate_multiple_experiences(building_batch_size)
-            while len(to_learn_from) > 0 and diff > tolerance:
-                table = self.qtable.copy()
-                self.learn_from_games_mp_symm(to_learn_from[:learning_batch_size])
-                to_learn_from = to_learn_from[learning_batch_size:]
-                self.count += learning_batch_size
-                diff = (table - self.qtable).abs().max().max()
-
-        return self.count
+        tracker = self.start_tracking(tracker)
+        rng = np.random.default_rng(random.getrandbits(32))
+
+        while True:
+            pool = self.table.sample_experiences(pool_size, rng)
+            error = self.replay_prioritized(pool, 0)
+            if error <= tracker.tolerance:
+                break
+            while error > tracker.tolerance:
+                error = self.replay_prioritized(pool, 1, learning_batch_size)
+
+        self.stop_tracking()
+        return (self.count, tracker.trace) if return_trace else self.count
+
+    def is_fully_trained_mp(self, tracker=None, return_trace=False, building_batch_size=5000, learning_batch_size=1000):
+        """This method generates a batch of experiences to train on and then progressively trains through that batch determining if progress was made or not
+        it operates the same as .is_fully_trained() but takes advantage of multiprocessing.  The instrumentation, if
+        any, is flushed after every batch of building_batch_size experiences"""
+        return self.train_mp(self.learn_from_games_mp, tracker, return_trace, building_batch_size, learning_batch_size)
+
+    def is_fully_trained_mp_symm(self, tracker=None, return_trace=False, building_batch_size=5000, learning_batch_size=1000):
+        """The same as is_fully_trained_mp() but calls .learn_from_games_mp_symm() to take advantage of symmetries"""
+        return self.train_mp(self.learn_from_games_mp_symm, tracker, return_trace, building_batch_size, learning_batch_size)
+
+    def train_mp(self, learn, tracker, return_trace, building_batch_size, learning_batch_size):
+        """The loop shared by is_fully_trained_mp() and is_fully_trained_mp_symm(), learning with learn"""
+        tracker = self.start_tracking(tracker)
+        instrumentation = self.instrumentation
+        instrumentation.start()
+
+        try:
+            while not tracker.converged():
+                to_learn_from = self.generate_multiple_experiences(building_batch_size)
+                while len(to_learn_from) > 0 and not tracker.converged():
+                    learn(to_learn_from[:learning_batch_size])
+                    to_learn_from = to_learn_from[learning_batch_size:]
+                    self.count += learning_batch_size
+                    with instrumentation.phase('convergence'):
+                        tracker.end_batch()
+                instrumentation.flush('batch')
+        finally:
+            instrumentation.stop()
+
+        self.stop_tracking()
+        return (self.count, tracker.trace) if return_trace else self.count
@@ -0,0 +1,521 @@
+import DotsBoard as Dots
+import functools
+import numpy as np
+import pandas as pd
+import struct
+
+MAGIC = b'DOTSQTB\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIIddqI')
+ARRAY = struct.Struct('<16s8sIQQQ')
+ALIGNMENT = 4096
+
+def move_tables(n, m, states):
+    """Returns the transition and reward tables of an array of integer states on nxm boards, one array operation per
+    edge.  transitions[i, move] is the state reached from states[i] by move (-1 if already played) and rewards[i, move]
+    the number of boxes that move completes"""
+    edge_bits, box_masks, edge_boxes = Dots.edge_masks(n, m)
+    states = np.asarray(states, dtype=np.int64)
+    transitions = np.empty((len(states), len(edge_bits)), dtype=np.int64)
+    rewards = np.zeros((len(states), len(edge_bits)), dtype=np.int8)
+
+    for move, bit in enumerate(edge_bits):
+        free = (states & bit) == 0
+        after = states | bit
+        completed = np.zeros(len(states), dtype=np.int8)
+        for mask in edge_boxes[move]:
+            completed += (after & mask) == mask
+
+        transitions[:, move] = np.where(free, after, -1)
+        rewards[:, move] = np.where(free, completed, 0)
+
+    return transitions, rewards
+
+def symmetry_tables(perms, lines):
+    """Compiles symmetries, an array of shape (symmetries, lines) in the format of DotsPlayer.symmetries, into byte
+    lookup tables.  tables[k, j, b] is the image under symmetry k of the bits b found in byte j of a state, so the
+    image of a whole state is the OR of one lookup per byte"""
+    tables = np.zeros((len(perms), (lines + 7) // 8, 256), dtype=np.int64)
+    byte = np.arange(256, dtype=np.int64)
+
+    for k, order in enumerate(perms):
+        for i, e in enumerate(order):
+            j, offset = divmod(lines - 1 - e, 8)
+            tables[k, j] |= ((byte >> offset) & 1) << (lines - 1 - i)
+
+    return tables
+
+def symmetry_images(states, tables):
+    """Applies every symmetry compiled in tables (see symmetry_tables) to an array of integer states.  Returns an
+    array of shape (states, symmetries)"""
+    states = np.asarray(states, dtype=np.int64)
+    images = np.zeros((len(states), tables.shape[0]), dtype=np.int64)
+
+    for j in range(tables.shape[1]):
+        images |= tables[:, j, (states >> (8*j)) & 255].T
+
+    return images
+
+class QTable:
+    """
+    A dense Q-table backend for a DotsPlayer.  Boards are identified by their
+    integer encoding int(board, 2), so the state "0011010" is row 26.  Example:
+    my_table.values is a float32 ndarray of shape (2**lines, lines);
+      my_table.values[26, 3] is the value of making move 3 in state "0011010"
+    my_table.transitions[26, 3] is the state reached by that move, or -1 if
+      move 3 has already been played in that state
+    my_table.rewards[26, 3] is the number of boxes completed by that move
+    """
+
+    shared = ('values', 'transitions', 'rewards')
+    kind = 0
+
+    def __init__ ( self, n, m ):
+        """
+        Allocate the value, transition and reward arrays for nxm boards.  The
+        tables are empty until build() is called.
+        """
+        self.set_dimensions(n, m)
+
+        self.values = np.zeros((self.num_states, self.lines), dtype=np.float32)
+        self.transitions = np.full((self.num_states, self.lines), -1, dtype=self.state_dtype)
+        self.rewards = np.zeros((self.num_states, self.lines), dtype=np.int8)
+
+    @classmethod
+    def from_arrays(cls, n, m, arrays):
+        """Rebuilds a table for nxm boards around existing arrays, such as views of shared memory.  arrays maps the
+        names in cls.shared to the arrays to use"""
+        table = cls.__new__(cls)
+        table.set_dimensions(n, m)
+        for name, array in arrays.items():
+            setattr(table, name, array)
+        return table
+
+    def set_dimensions(self, n, m):
+        """Records the board size and the sizes derived from it"""
+        self.n = n
+        self.m = m
+        self.lines = m + ((2*m)+1)*n
+        self.num_states = 2**self.lines
+        self.state_dtype = np.int32 if self.lines < 32 else np.int64
+        self.edge_bits = Dots.edge_masks(n, m)[0]
+
+    def build(self):
+        """Fills the transition and reward tables for every state at once, one array operation per edge, and starts
+        the Q-values off at the immediate rewards.  States are processed in chunks to bound the temporaries"""
+        chunk = 2**20
+
+        for start in range(0, self.num_states, chunk):
+            stop = min(start + chunk, self.num_states)
+            transitions, rewards = move_tables(self.n, self.m, np.arange(start, stop))
+            self.transitions[start:stop] = transitions
+            self.rewards[start:stop] = rewards
+
+        self.values[:, :] = self.rewards
+
+    def row_states(self):
+        """Returns the state stored in each row of the tables"""
+        return range(self.num_states)
+
+    def locate(self, state, move):
+        """Returns the (row, column) of the tables holding move in state"""
+        return state, move
+
+    def locate_batch(self, states, moves):
+        """Returns the (rows, columns) of the tables holding arrays of moves in arrays of states"""
+        return states, moves
+
+    def get(self, state, move):
+        """Returns the Q-value of making move in state"""
+        return self.values.item(state, move)
+
+    def set(self, state, move, value):
+        """Stores the Q-value of making move in state"""
+        self.values[state, move] = value
+
+    def row(self, state):
+        """Returns the Q-values of every move from state, indexed by move"""
+        return self.values[state]
+
+    def peek(self, state):
+        """Same as .row(), for lookups that must leave the table as it is"""
+        return self.row(state)
+
+    def peek_batch(self, states):
+        """Returns the Q-values of every move from each state in an array, one row per state, without changing the
+        table"""
+        rows, columns = self.locate_batch(np.asarray(states, dtype=np.int64)[:, None], np.arange(self.lines))
+        return self.values[rows, columns]
+
+    def transition(self, state, move):
+        """Returns the state reached by making move in state"""
+        return self.transitions.item(state, move)
+
+    def reward(self, state, move):
+        """Returns the number of boxes completed by making move in state"""
+        return self.rewards.item(state, move)
+
+    def sample_experiences(self, count, rng):
+        """Generates count experiences at once, the way DotsPlayer.create_experience() does one at a time: a random
+        unfinished start state, a random legal move, the state and reward it leads to and the best move from there
+        according to the current Q-values (ties broken at random, -1 once the game is over).  rng is a numpy
+        Generator.  Returns an int64 array with one (start_state, move, new_state, reward, best_move) row each"""
+        shifts = self.lines - 1 - np.arange(self.lines, dtype=np.int64)
+        states = rng.integers(0, self.num_states - 1, count, dtype=np.int64)
+        free = ((states[:, None] >> shifts) & 1) == 0
+        moves = np.where(free, rng.random(free.shape), -1).argmax(axis=1)
+        new_states = states | (np.int64(1) << shifts[moves])
+        rows, columns = self.locate_batch(states, moves)
+        rewards = self.rewards[rows, columns]
+        best_moves = self.best_moves(new_states, rng)
+
+        return np.stack([states, moves, new_states, rewards, best_moves], axis=1)
+
+    def best_moves(self, states, rng):
+        """Returns the best move of every state in an array according to the current Q-values, ties broken at random
+        with the numpy Generator rng, and -1 for finished games.  The table is left as it is (see .peek_batch())"""
+        shifts = self.lines - 1 - np.arange(self.lines, dtype=np.int64)
+        states = np.asarray(states, dtype=np.int64)
+        free = ((states[:, None] >> shifts) & 1) == 0
+        values = np.where(free, self.peek_batch(states), -np.inf)
+        ties = free & (values == values.max(axis=1, keepdims=True))
+        return np.where(ties.any(axis=1), np.where(ties, rng.random(ties.shape), -1).argmax(axis=1), -1)
+
+    def to_frame(self, name='values'):
+        """Exports one of the tables ('values', 'transitions' or 'rewards') as a pandas DataFrame indexed by binary board
+        strings.  This is meant for inspection only, the DataFrame is several times the size of the array"""
+        index = [format(i, 'b').zfill(self.lines) for i in self.row_states()]
+        return pd.DataFrame(getattr(self, name), index=index, columns=range(self.lines))
+
+
+class CanonicalQTable(QTable):
+    """
+    A Q-table backend that only stores canonical representatives of the board
+    states.  Every state is mapped to its smallest symmetric image; the tables
+    hold one row per canonical state with the moves in that state's order.
+    my_table.row_of[state] is the row holding state's symmetry class
+    my_table.sym_of[state] is the symmetry taking state to its representative
+    my_table.inverse[sym_of[state], move] is the column of move in that row
+    On square boards this stores about an eighth of the rows of a QTable.
+    """
+
+    shared = QTable.shared + ('row_of', 'sym_of', 'inverse', 'canonical_states')
+    kind = 1
+
+    def __init__ ( self, n, m, symmetries ):
+        """
+        Compute the canonical representative of every nxm board under the given
+        symmetries (as in DotsPlayer.symmetries) and allocate one row for each.
+        """
+        self.set_dimensions(n, m)
+
+        self.perms = np.array(symmetries, dtype=np.intp)
+        self.inverse = np.argsort(self.perms, axis=1)
+        self.tables = symmetry_tables(self.perms, self.lines)
+
+        canonical = np.empty(self.num_states, dtype=np.int64)
+        self.sym_of = np.empty(self.num_states, dtype=np.int8)
+        chunk = 2**14
+
+        for start in range(0, self.num_states, chunk):
+            stop = min(start + chunk, self.num_states)
+            images = symmetry_images(np.arange(start, stop), self.tables)
+            self.sym_of[start:stop] = images.argmin(axis=1)
+            canonical[start:stop] = images.min(axis=1)
+
+        self.canonical_states = np.unique(canonical)
+        self.row_of = np.searchsorted(self.canonical_states, canonical).astype(self.state_dtype)
+        del canonical
+
+        rows = len(self.canonical_states)
+        self.values = np.zeros((rows, self.lines), dtype=np.float32)
+        self.transitions = np.full((rows, self.lines), -1, dtype=self.state_dtype)
+        self.rewards = np.zeros((rows, self.lines), dtype=np.int8)
+
+    def build(self):
+        """Fills the transition and reward tables for the canonical states and starts the Q-values off at the
+        immediate rewards"""
+        chunk = 2**20
+
+        for start in range(0, len(self.canonical_states), chunk):
+            stop = min(start + chunk, len(self.canonical_states))
+            transitions, rewards = move_tables(self.n, self.m, self.canonical_states[start:stop])
+            self.transitions[start:stop] = transitions
+            self.rewards[start:stop] = rewards
+
+        self.values[:, :] = self.rewards
+
+    def locate(self, state, move):
+        """Returns the (row, column) of the tables holding move in state"""
+        return self.row_of.item(state), self.inverse.item(self.sym_of.item(state), move)
+
+    def locate_batch(self, states, moves):
+        return self.row_of[states], self.inverse[self.sym_of[states], moves]
+
+    def row_states(self):
+        return self.canonical_states
+
+    def get(self, state, move):
+        return self.values.item(*self.locate(state, move))
+
+    def set(self, state, move, value):
+        self.values[self.locate(state, move)] = value
+
+    def row(self, state):
+        return self.values[self.row_of.item(state), self.inverse[self.sym_of.item(state)]]
+
+    def transition(self, state, move):
+        bit = self.edge_bits[move]
+        return -1 if state & bit else state | bit
+
+    def reward(self, state, move):
+        return self.rewards.item(*self.locate(state, move))
+
+
+class LazyQTable(QTable):
+    """
+    A Q-table backend that only stores the states training actually reaches.
+    A row is added the first time a state is located, with the rewards of its
+    moves and Q-values starting at those rewards as build() would leave them,
+    so nothing is computed up front and memory grows with the states visited.
+    my_table.index[state] is the row holding state
+    my_table.states[row] is the state stored in that row
+    my_table.values and my_table.rewards have one row per stored state
+    my_table.moves(state) returns the transitions and rewards of every move of
+      state, computed from the edge masks and kept in an LRU cache of
+      cache_size states
+    my_table.peek(state) and my_table.peek_batch(states) value states that are
+      not stored the same way without adding them, so playing leaves the
+      table as training left it
+    my_table.transitions is computed for the stored states when asked for.
+    """
+
+    shared = ('states', 'values', 'rewards')
+    kind = 2
+
+    def __init__ ( self, n, m, cache_size=2**16 ):
+        """
+        Set up an empty table for nxm boards.  build() has nothing to do.
+        """
+        self.set_dimensions(n, m)
+        self.set_cache(cache_size)
+        self.state_store = np.zeros(0, dtype=np.int64)
+        self.value_store = np.zeros((0, self.lines), dtype=np.float32)
+        self.reward_store = np.zeros((0, self.lines), dtype=np.int8)
+        self.size = 0
+        self.index = {}
+
+    @classmethod
+    def from_arrays(cls, n, m, arrays):
+        table = super().from_arrays(n, m, arrays)
+        table.set_cache(2**16)
+        table.index = dict(zip(table.states.tolist(), range(table.size)))
+        return table
+
+    def set_cache(self, cache_size):
+        """Sets up the LRU cache of .moves() for cache_size states"""
+        self.edge_boxes = Dots.edge_masks(self.n, self.m)[2]
+        self.moves = functools.lru_cache(maxsize=cache_size)(self.compute_moves)
+
+    def compute_moves(self, state):
+        """Returns the transitions and rewards of every move of state as two tuples, -1 and 0 for moves already
+        played"""
+        transitions = []
+        rewards = []
+        for bit, boxes in zip(self.edge_bits, self.edge_boxes):
+            if state & bit:
+                transitions.append(-1)
+                rewards.append(0)
+            else:
+                after = state | bit
+                transitions.append(after)
+                rewards.append(sum( 1 for mask in boxes if after & mask == mask ))
+        return tuple(transitions), tuple(rewards)
+
+    @property
+    def states(self):
+        return self.state_store[:self.size]
+
+    @states.setter
+    def states(self, array):
+        self.state_store = array
+        self.size = len(array)
+
+    @property
+    def values(self):
+        return self.value_store[:self.size]
+
+    @values.setter
+    def values(self, array):
+        self.value_store = array
+        self.size = len(array)
+
+    @property
+    def rewards(self):
+        return self.reward_store[:self.size]
+
+    @rewards.setter
+    def rewards(self, array):
+        self.reward_store = array
+        self.size = len(array)
+
+    @property
+    def transitions(self):
+        return move_tables(self.n, self.m, self.states)[0]
+
+    def build(self):
+        """Rows are made as states are reached, so there is nothing to build"""
+        pass
+
+    def reserve(self, rows):
+        """Makes room for rows rows, at least doubling the storage when it has to grow.  The arrays are always
+        replaced rather than resized, since they may be views of shared memory or of a checkpoint"""
+        if rows <= len(self.state_store):
+            return
+        capacity = max(rows, 2 * len(self.state_store), 1024)
+        for name in ('state_store', 'value_store', 'reward_store'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add_rows(self, states):
+        """Stores new states, which must not be in the table yet, and returns their rows"""
+        first = self.size
+        rows = np.arange(first, first + len(states))
+        self.reserve(first + len(states))
+        rewards = move_tables(self.n, self.m, states)[1]
+        self.state_store[rows] = states
+        self.reward_store[rows] = rewards
+        self.value_store[rows] = rewards
+        self.index.update(zip(states.tolist(), rows.tolist()))
+        self.size = first + len(states)
+        return rows
+
+    def add_row(self, state):
+        """Stores one new state and returns its row"""
+        row = self.size
+        self.reserve(row + 1)
+        rewards = self.moves(state)[1]
+        self.state_store[row] = state
+        self.reward_store[row] = rewards
+        self.value_store[row] = rewards
+        self.index[state] = row
+        self.size = row + 1
+        return row
+
+    def locate(self, state, move):
+        row = self.index.get(state)
+        return (self.add_row(state) if row is None else row), move
+
+    def locate_batch(self, states, moves):
+        states = np.asarray(states, dtype=np.int64)
+        unique, inverse = np.unique(states, return_inverse=True)
+        index = self.index
+        rows = np.fromiter(( index.get(state, -1) for state in unique.tolist() ), dtype=np.int64, count=len(unique))
+        missing = rows < 0
+        if missing.any():
+            rows[missing] = self.add_rows(unique[missing])
+        return rows[inverse].reshape(states.shape), moves
+
+    def row_states(self):
+        return self.states
+
+    def get(self, state, move):
+        row = self.locate(state, move)[0]
+        return self.value_store.item(row, move)
+
+    def set(self, state, move, value):
+        row = self.locate(state, move)[0]
+        self.value_store[row, move] = value
+
+    def row(self, state):
+        row = self.locate(state, 0)[0]
+        return self.value_store[row]
+
+    def peek(self, state):
+        row = self.index.get(state)
+        return np.array(self.moves(state)[1], dtype=np.float32) if row is None else self.value_store[row]
+
+    def peek_batch(self, states):
+        """States that are not stored are valued at their rewards, as a fresh row would be, without being added"""
+        states = np.asarray(states, dtype=np.int64)
+        index = self.index
+        rows = np.fromiter(( index.get(state, -1) for state in states.tolist() ), dtype=np.int64, count=len(states))
+        known = rows >= 0
+        values = np.empty((len(states), self.lines), dtype=np.float32)
+        values[known] = self.values[rows[known]]
+        if not known.all():
+            values[~known] = move_tables(self.n, self.m, states[~known])[1]
+        return values
+
+    def transition(self, state, move):
+        return self.moves(state)[0][move]
+
+    def reward(self, state, move):
+        return self.moves(state)[1][move]
+
+
+TABLES = { QTable.kind: QTable, CanonicalQTable.kind: CanonicalQTable, LazyQTable.kind: LazyQTable }
+
+def save_table(table, path, alpha, gamma, count):
+    """
+    Writes a table to a checkpoint file.  The file starts with a header giving
+    the board size, the kind of table, alpha, gamma and the number of
+    experiences trained on, followed by one descriptor (name, dtype, shape,
+    offset) per array in table.shared.  The arrays follow in raw C order, each
+    starting on a page boundary so that they can be memory-mapped.
+    """
+    arrays = [ (name, np.ascontiguousarray(getattr(table, name))) for name in table.shared ]
+    offset = HEADER.size + ARRAY.size * len(arrays)
+    descriptors = []
+
+    for name, array in arrays:
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        shape = tuple(array.shape) + (0,) * (2 - array.ndim)
+        descriptors.append(ARRAY.pack(name.encode(), array.dtype.str.encode(), array.ndim, shape[0], shape[1], offset))
+        offset += array.nbytes
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, table.n, table.m, table.kind, alpha, gamma, count, len(arrays)))
+        for descriptor in descriptors:
+            f.write(descriptor)
+        for (name, array), descriptor in zip(arrays, descriptors):
+            f.seek(ARRAY.unpack(descriptor)[5])
+            array.tofile(f)
+
+def load_table(path, mmap_mode='r'):
+    """
+    Reads a checkpoint written by save_table().  With a mmap_mode ('r', 'c' or
+    'r+', as for numpy.memmap) the arrays are memory-mapped instead of read, so
+    loading is immediate and processes loading the same file share its pages;
+    with mmap_mode=None they are read into memory.  Returns the table and a
+    dict with the alpha, gamma and count stored in the header.
+    A LazyQTable grows by replacing its arrays, which leaves the mapping: with
+    'r' or 'c' it reads from the file until it gains a row and from memory
+    after that, and since it cannot be trained in place 'r+' reads it into
+    memory straight away.  Empty arrays, such as those of an empty LazyQTable,
+    are never mapped.
+    """
+    with open(path, 'rb') as f:
+        magic, version, n, m, kind, alpha, gamma, count, num_arrays = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} Q-table checkpoint')
+        descriptors = [ ARRAY.unpack(f.read(ARRAY.size)) for i in range(num_arrays) ]
+
+    if TABLES[kind] is LazyQTable and mmap_mode == 'r+':
+        mmap_mode = None
+
+    arrays = {}
+    for name, dtype, ndim, rows, columns, offset in descriptors:
+        shape = (rows, columns)[:ndim]
+        dtype = np.dtype(dtype.rstrip(b'\x00').decode())
+        if rows == 0 or (ndim == 2 and columns == 0):
+            array = np.zeros(shape, dtype=dtype)
+        elif mmap_mode is None:
+            array = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        else:
+            array = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape)
+        arrays[name.rstrip(b'\x00').decode()] = array
+
+    return TABLES[kind].from_arrays(n, m, arrays), { 'alpha': alpha, 'gamma': gamma, 'count': count }
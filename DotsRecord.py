@@ -0,0 +1,332 @@
+import DotsBoard as Dots
+from DotsSimulator import BatchSimulator
+import numpy as np
+import os
+import struct
+
+MAGIC = b'DOTSREC\x00'
+VERSION = 2
+HEADER = struct.Struct('<8sIIIQQ')
+
+def encode_varints(values):
+    """Returns the LEB128 varint encoding of a sequence of non-negative integers"""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+def decode_varints(data):
+    """Decodes every complete varint in a bytes-like object at once.  Returns the values as an int64 array and the
+    number of bytes they used; the bytes after that start a varint cut off by the end of the data"""
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) and data.max() < 0x80:
+        return data.astype(np.int64), len(data)
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) == 0:
+        return np.empty(0, dtype=np.int64), 0
+    used = int(ends[-1]) + 1
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    groups = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = 7 * (np.arange(used) - starts[groups])
+    return np.add.reduceat((data[:used] & 0x7f).astype(np.int64) << shifts, starts), used
+
+def split_records(values, levels=4):
+    """Finds the games in an array of decoded varints that starts with a game.  Every value is treated as the start
+    of a record pointing at the next one; pointer jumping gives the record 2**levels records on from each, so only
+    every 2**levels-th game is found one at a time, and the games between are filled in with array indexing.
+    Returns the starts of the complete games and the number of values they use"""
+    size = len(values)
+    step = np.minimum(values, size).astype(np.int32)
+    step += np.arange(3, size + 3, dtype=np.int32)
+    step = np.append(np.minimum(step, size + 1), [size + 1, size + 1]).astype(np.int32)
+    jumps = step
+    for k in range(levels):
+        jumps = jumps.take(jumps)
+
+    strides = []
+    pos = 0
+    while pos < size:
+        strides.append(pos)
+        pos = int(jumps[pos])
+    starts = [np.array(strides, dtype=np.int32)]
+    for k in range((1 << levels) - 1):
+        starts.append(step.take(starts[-1]))
+    starts = np.stack(starts, axis=1).ravel()
+    complete = starts[step.take(starts) <= size]
+    return complete, int(step[complete[-1]]) if len(complete) else 0
+
+
+class RecordWriter:
+    """
+    Appends finished or partial games to a game-record file.  The file starts
+    with a fixed header (magic, version, board size, and the length and game
+    count of the part of the file written so far) followed by one record per
+    game: the number of moves, the moves and the final scores of player one
+    and player two, all as varints, so a 3x3 game takes 27 bytes.
+    The length in the header is updated by .flush() and .close(), so games
+    written after the last flush are lost if the program crashes; readers
+    stop at that length and opening the file again for appending cuts off
+    whatever follows it, without reading the games before it.
+    Example:
+    with RecordWriter('games.rec', 3, 3) as my_writer:
+        my_writer.write_board(board) records a DotsBoard game as played
+        my_writer.write(moves, (score1, score2)) records a list of moves
+        my_writer.write_games(moves, scores) records a batch held in arrays
+    my_writer.count is the number of games it wrote, my_writer.games the
+      number in the file
+    """
+
+    def __init__ ( self, path, n, m ):
+        self.path = path
+        self.n = n
+        self.m = m
+        self.lines = m + ((2*m)+1)*n
+        self.count = 0
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.file = open(path, 'r+b')
+            try:
+                file_n, file_m, self.size, self.games = read_header(self.file, path)
+                if (file_n, file_m) != (n, m):
+                    raise ValueError(f'{path} holds {file_n}x{file_m} games, not {n}x{m}')
+            except ValueError:
+                self.file.close()
+                raise
+            self.file.truncate(self.size)
+            self.file.seek(self.size)
+        else:
+            self.file = open(path, 'w+b')
+            self.size = HEADER.size
+            self.games = 0
+            self.file.write(self.header())
+
+    def header(self):
+        return HEADER.pack(MAGIC, VERSION, self.n, self.m, self.size, self.games)
+
+    def append(self, data, games):
+        self.file.write(data)
+        self.size += len(data)
+        self.games += games
+        self.count += games
+
+    def write(self, moves, scores):
+        """Records one game given as a sequence of moves and the scores of player one and player two"""
+        moves = list(moves)
+        self.append(encode_varints([len(moves)] + moves + [int(scores[0]), int(scores[1])]), 1)
+
+    def write_board(self, board):
+        """Records the moves played on a DotsBoard since it was set up (see DotsBoard.order()) and its scores"""
+        self.write(board.order(), (board.score1, board.score2))
+
+    def write_games(self, moves, scores):
+        """Records a batch of games at once.  moves is an int array with one row per game, padded with -1 after the
+        last move of games shorter than the board, and scores holds the two scores of every game"""
+        moves = np.asarray(moves, dtype=np.int64).reshape(len(scores), -1)
+        scores = np.asarray(scores, dtype=np.int64)
+        played = moves >= 0
+        rows = np.concatenate([played.sum(axis=1, keepdims=True), moves, scores], axis=1)
+        keep = np.concatenate([np.ones((len(moves), 1), dtype=bool), played, np.ones((len(moves), 2), dtype=bool)], axis=1)
+        values = rows[keep]
+
+        if len(values) and values.max() < 0x80:
+            self.append(values.astype(np.uint8).tobytes(), len(moves))
+        else:
+            self.append(encode_varints(values.tolist()), len(moves))
+
+    def flush(self):
+        """Writes the games out and then records their length in the header, which makes them part of the file"""
+        self.file.flush()
+        self.file.seek(0)
+        self.file.write(self.header())
+        self.file.seek(self.size)
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_header(f, path):
+    """Reads the header of a game-record file and returns its board size, the length of the file written so far
+    and the number of games in it"""
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError(f'{path} is too short to be a game-record file')
+    magic, version, n, m, size, games = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{path} is not a version {VERSION} game-record file')
+    if size < HEADER.size or size > os.fstat(f.fileno()).st_size:
+        raise ValueError(f'{path} is shorter than its header says')
+    return n, m, size, games
+
+
+class RecordReader:
+    """
+    Streams the games of a file written by RecordWriter, reading chunk_size
+    bytes at a time, so files of any size are read in constant memory.  Games
+    written after the writer last flushed are not read.
+    Example:
+    my_reader = RecordReader('games.rec')
+    my_reader.n and my_reader.m are the board size, my_reader.games the
+      number of games
+    for moves, scores in my_reader: goes through the games one by one
+    for moves, scores in my_reader.batches(1000): goes through them as
+      arrays of up to 1000 games, moves padded with -1 as in
+      RecordWriter.write_games()
+    """
+
+    def __init__ ( self, path, chunk_size=2**20 ):
+        self.path = path
+        self.chunk_size = chunk_size
+        with open(path, 'rb') as f:
+            self.n, self.m, self.size, self.games = read_header(f, path)
+        self.lines = self.m + ((2*self.m)+1)*self.n
+
+    def values(self):
+        """Yields the varints of the file as arrays, one chunk at a time"""
+        with open(self.path, 'rb') as f:
+            f.seek(HEADER.size)
+            left = self.size - HEADER.size
+            rest = b''
+            while left > 0:
+                chunk = f.read(min(self.chunk_size, left))
+                if not chunk:
+                    raise ValueError(f'{self.path} is shorter than its header says')
+                left -= len(chunk)
+                data = rest + chunk
+                values, used = decode_varints(data)
+                rest = data[used:]
+                yield values
+            if rest:
+                raise ValueError(f'{self.path} ends in the middle of a varint')
+
+    def records(self):
+        """Yields the varints of the file a chunk at a time with the starts of the complete games in them (see
+        split_records); a game cut off by the end of a chunk is carried over to the next one"""
+        rest = np.empty(0, dtype=np.int64)
+        for values in self.values():
+            values = np.concatenate([rest, values])
+            starts, used = split_records(values)
+            yield values, starts
+            rest = values[used:]
+        if len(rest):
+            raise ValueError(f'{self.path} ends in the middle of a game')
+
+    def __iter__(self):
+        for values, starts in self.records():
+            counts = values[starts].tolist()
+            values = values.tolist()
+            for start, count in zip(starts.tolist(), counts):
+                end = start + count + 1
+                yield values[start + 1:end], (values[end], values[end + 1])
+
+    def unpack(self, values, starts):
+        """Returns the games starting at starts as a move array padded with -1 and a score array"""
+        counts = values[starts]
+        if len(counts) and counts.max() > self.lines:
+            raise ValueError(f'{self.path} holds a game longer than a {self.n}x{self.m} board')
+        columns = np.arange(self.lines)
+        played = columns < counts[:, None]
+        moves = np.where(played, values[np.where(played, starts[:, None] + 1 + columns, 0)], -1)
+        ends = starts + counts + 1
+        return moves, np.stack([values[ends], values[ends + 1]], axis=1)
+
+    def batches(self, size=1000):
+        """Yields the games size at a time as a (games, lines) move array padded with -1 and a (games, 2) score
+        array"""
+        moves = np.empty((0, self.lines), dtype=np.int64)
+        scores = np.empty((0, 2), dtype=np.int64)
+        for values, starts in self.records():
+            chunk_moves, chunk_scores = self.unpack(values, starts)
+            moves = np.concatenate([moves, chunk_moves])
+            scores = np.concatenate([scores, chunk_scores])
+            pos = 0
+            while len(moves) - pos >= size:
+                yield moves[pos:pos + size], scores[pos:pos + size]
+                pos += size
+            moves = moves[pos:]
+            scores = scores[pos:]
+
+        if len(moves):
+            yield moves, scores
+
+
+def replay(moves, n, m):
+    """
+    Replays a batch of games through the bitboards at once.  moves is an int
+    array with one row per game, padded with -1.  Returns int64 arrays of one
+    (state, move, new_state, reward) row per move played, where the reward is
+    the number of boxes the move completed, in the order of the games.
+    Raises ValueError if a game plays an edge twice.
+    """
+    shape = Dots.geometry(n, m)
+    moves = np.asarray(moves, dtype=np.int64)
+    bits = np.array(shape.edge_bits, dtype=np.int64)
+    box_masks = np.zeros((shape.lines, 2), dtype=np.int64)
+    for move, masks in enumerate(shape.edge_boxes):
+        box_masks[move, :len(masks)] = masks
+
+    played = moves >= 0
+    safe = np.where(played, moves, 0)
+    drawn = np.where(played, bits[safe], 0)
+    new_states = np.bitwise_or.accumulate(drawn, axis=1)
+    states = np.concatenate([np.zeros((len(moves), 1), dtype=np.int64), new_states[:, :-1]], axis=1)
+    if np.any(states & drawn):
+        raise ValueError('illegal move: edge already played')
+
+    masks = box_masks[safe]
+    rewards = (((new_states[..., None] & masks) == masks) & (masks != 0)).sum(axis=2)
+    return states[played], moves[played], new_states[played], rewards[played]
+
+def read_experiences(path, table, batch_games=1000, rng=None):
+    """
+    Streams the games of a record file as experiences, batch_games games at a
+    time: int64 arrays with one (start_state, move, new_state, reward,
+    best_move) row per move, the layout .generate_multiple_experiences() and
+    .learn_from_games_mp() of DotsPlayer use.  The best move of every new
+    state is looked up in table (a QTable of any kind) as it is when the batch
+    is read, with ties broken by the numpy Generator rng.  A best_move of -1
+    means the game is over, so there is no default table; replay() the
+    batches of a RecordReader to get the experiences without best moves.
+    Only one batch is in memory at a time.
+    """
+    if table is None:
+        raise ValueError('read_experiences needs a Q-table to look the best moves up in')
+    reader = RecordReader(path)
+    rng = rng if rng is not None else np.random.default_rng()
+
+    for moves, scores in reader.batches(batch_games):
+        states, played, new_states, rewards = replay(moves, reader.n, reader.m)
+        best_moves = table.best_moves(new_states, rng)
+        yield np.stack([states, played, new_states, rewards, best_moves], axis=1)
+
+def record_self_play(path, n, m, num_games, policies=(None, None), batch_games=10000, seed=None):
+    """Plays num_games nxm games on a BatchSimulator, batch_games at a time, with one policy per player as in
+    BatchSimulator.actions() (None plays randomly), and appends them to a record file.  Returns the number of games
+    written"""
+    sim = BatchSimulator(n, m, min(batch_games, num_games), seed=seed)
+
+    with RecordWriter(path, n, m) as writer:
+        while writer.count < num_games:
+            count = min(batch_games, num_games - writer.count)
+            if count != sim.num_games:
+                sim = BatchSimulator(n, m, count, seed=sim.rng.integers(2**32))
+            sim.reset()
+            moves = np.full((count, sim.lines), -1, dtype=np.int64)
+            for k in range(sim.lines):
+                actions = sim.actions(policies)
+                moves[:, k] = actions
+                sim.step(actions)
+            writer.write_games(moves, sim.scores)
+            writer.flush()
+        return writer.count
@@ -0,0 +1,258 @@
+import DotsBoard as Dots
+from DotsChains import ChainAnalyzer
+import random
+import time
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget of a move runs out"""
+    pass
+
+
+class TranspositionTable:
+    """
+    A fixed-size table of search results keyed by Zobrist hashes.  Each hash
+    maps to one slot; a slot is overwritten by a search of at least the same
+    depth, or by anything once it was stored by an earlier move's search, so
+    the table never grows past its size and deep fresh results are kept.
+    """
+
+    def __init__ ( self, size=2**20 ):
+        self.size = size
+        self.mask = size - 1
+        self.keys = [None] * size
+        self.depths = [0] * size
+        self.values = [0] * size
+        self.flags = [EXACT] * size
+        self.moves = [None] * size
+        self.ages = [0] * size
+        self.age = 0
+
+    def new_search(self):
+        """Marks every stored entry as coming from an earlier search"""
+        self.age += 1
+
+    def probe(self, key, state):
+        """Returns the (depth, value, flag, move) stored for state, or None"""
+        slot = key & self.mask
+        if self.keys[slot] == state:
+            return self.depths[slot], self.values[slot], self.flags[slot], self.moves[slot]
+        return None
+
+    def store(self, key, state, depth, value, flag, move):
+        """Stores a search result for state unless its slot holds a deeper result of the current search"""
+        slot = key & self.mask
+        if self.keys[slot] is not None and self.ages[slot] == self.age and self.depths[slot] > depth and self.keys[slot] != state:
+            return
+        self.keys[slot] = state
+        self.depths[slot] = depth
+        self.values[slot] = value
+        self.flags[slot] = flag
+        self.moves[slot] = move
+        self.ages[slot] = self.age
+
+
+class SearchPlayer:
+    """
+    A player that picks moves by searching the game tree instead of looking
+    them up in a Q-table, for boards too large for DotsPlayer.  Values are box
+    differences from the point of view of the side to move: completing a box
+    keeps the turn, so its reward is added to the value of the next position,
+    while any other move hands the turn over and negates it.
+    The search is iterative deepening alpha-beta with a transposition table.
+    Box completions are searched first and do not use up depth, moves that
+    leave no three-sided box come next and third edges last.  Past the depth
+    limit only captures are searched, and a position without any scores 0.
+    Each move is given time_limit seconds; the move of the deepest finished
+    iteration is played.  With endgame=True positions where every box has two
+    sides drawn are not searched but valued exactly by a ChainAnalyzer.
+    Example:
+    my_player = SearchPlayer(3, 3, time_limit=0.5)
+    my_player.best_move(board) takes a board as a binary string, an integer or
+      a DotsBoard instance and returns the move, like DotsPlayer.best_move()
+    """
+
+    def __init__ ( self, n, m, time_limit=1.0, max_depth=None, table_size=2**20, seed=None, endgame=True ):
+        a = Dots.DotsBoard(n,m)
+        self.n = n
+        self.m = m
+        self.lines = a.lines
+        self.edge_bits = a.edge_bits
+        self.edge_boxes = a.edge_boxes
+        self.box_masks = a.box_masks
+        self.chains = ChainAnalyzer(n,m) if endgame else None
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.table = TranspositionTable(table_size)
+
+        rng = random.Random(seed)
+        self.zobrist = [ rng.getrandbits(64) for i in range(self.lines) ]
+        self.nodes = 0
+        self.depth = 0
+        self.deadline = None
+
+    def zobrist_key(self, state):
+        """Returns the Zobrist hash of an integer state, the XOR of the keys of its played edges"""
+        key = 0
+        for bit, edge_key in zip(self.edge_bits, self.zobrist):
+            if state & bit:
+                key ^= edge_key
+        return key
+
+    def legal_moves(self, state):
+        """Returns the moves yet to be played in an integer state"""
+        return [ i for i, bit in enumerate(self.edge_bits) if not state & bit ]
+
+    def completed(self, state, move):
+        """Returns the number of boxes completed by playing move in state"""
+        after = state | self.edge_bits[move]
+        return sum(1 for mask in self.edge_boxes[move] if after & mask == mask)
+
+    def is_endgame(self, state):
+        """True once every box has at least two sides drawn, so the position splits into chains and loops"""
+        return all( bin(state & mask).count('1') >= 2 for mask in self.box_masks )
+
+    def ordered_moves(self, state, first=None):
+        """Returns the legal moves of state as (move, boxes completed) pairs, ordered captures first, then safe moves
+        and third edges last.  first, the best move found earlier for this state, goes to the front"""
+        captures, safe, third = [], [], []
+        for move, bit in enumerate(self.edge_bits):
+            if state & bit:
+                continue
+            after = state | bit
+            sides = [ bin(after & mask).count('1') for mask in self.edge_boxes[move] ]
+            boxes = sides.count(4)
+            if boxes:
+                captures.append((move, boxes))
+            elif 3 in sides:
+                third.append((move, 0))
+            else:
+                safe.append((move, 0))
+
+        moves = captures + safe + third
+        if first is not None:
+            for i, (move, boxes) in enumerate(moves):
+                if move == first:
+                    moves.insert(0, moves.pop(i))
+                    break
+        return moves
+
+    def negamax(self, state, key, depth, alpha, beta):
+        """Returns the value of state for the side to move, searched depth plies deep (captures excluded)"""
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+        first = None
+        entry = self.table.probe(key, state)
+        if entry is not None:
+            stored_depth, value, flag, first = entry
+            if stored_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value >= beta:
+                    return value
+                if flag == UPPER and value <= alpha:
+                    return value
+
+        if self.chains is not None and self.is_endgame(state):
+            value = self.chains.analyze(state).value()
+            self.table.store(key, state, self.lines, value, EXACT, None)
+            return value
+
+        moves = self.ordered_moves(state, first)
+        if not moves:
+            return 0
+
+        original_alpha = alpha
+        best_value = None
+        best = None
+        if depth <= 0:
+            moves = [ (move, boxes) for move, boxes in moves if boxes ]
+            best_value = 0
+            alpha = max(alpha, 0)
+            if not moves or alpha >= beta:
+                return best_value
+
+        for move, boxes in moves:
+            after = state | self.edge_bits[move]
+            after_key = key ^ self.zobrist[move]
+            if boxes:
+                value = boxes + self.negamax(after, after_key, depth, alpha - boxes, beta - boxes)
+            else:
+                value = -self.negamax(after, after_key, depth - 1, -beta, -alpha)
+
+            if best_value is None or value > best_value:
+                best_value = value
+                best = move
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(key, state, depth, best_value, flag, best)
+        return best_value
+
+    def search(self, state, depth):
+        """Searches state to the given depth and returns (value, best move)"""
+        key = self.zobrist_key(state)
+        alpha, beta = -self.lines, self.lines
+        best_value = None
+        best = None
+        entry = self.table.probe(key, state)
+
+        for move, boxes in self.ordered_moves(state, entry[3] if entry is not None else None):
+            after = state | self.edge_bits[move]
+            if boxes:
+                value = boxes + self.negamax(after, key ^ self.zobrist[move], depth, alpha - boxes, beta - boxes)
+            else:
+                value = -self.negamax(after, key ^ self.zobrist[move], depth - 1, -beta, -alpha)
+            if best_value is None or value > best_value:
+                best_value = value
+                best = move
+            alpha = max(alpha, value)
+
+        self.table.store(key, state, depth, best_value, EXACT, best)
+        return best_value, best
+
+    def best_move ( self, board ):
+        """
+        Searches for the best move of the given board within the time budget
+        and returns the move (not its value), or None if the game is over.
+        """
+        state = Dots.state_id(board)
+        remaining = self.lines - bin(state).count('1')
+        if remaining == 0:
+            return None
+        if self.chains is not None and self.is_endgame(state):
+            return self.chains.analyze(state).optimal_move()
+
+        self.table.new_search()
+        self.nodes = 0
+        self.deadline = time.perf_counter() + self.time_limit if self.time_limit is not None else None
+        max_depth = remaining if self.max_depth is None else min(self.max_depth, remaining)
+        best = self.ordered_moves(state)[0][0]
+
+        try:
+            for depth in range(1, max_depth + 1):
+                value, move = self.search(state, depth)
+                best = move
+                self.depth = depth
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+
+        return best
+
+    def random_move ( self, board ):
+        """Picks randomly from the legal moves of the given board"""
+        legal_moves = self.legal_moves(Dots.state_id(board))
+        return random.choice(legal_moves) if legal_moves else None
@@ -0,0 +1,434 @@
+import DotsBoard as Dots
+from DotsPlayer import DotsPlayer
+from DotsEval import player_policy
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import random
+import sys
+import time
+import numpy as np
+
+class Metrics:
+    """
+    Counters and latency samples of a MatchServer.  Example:
+    my_metrics.counters['moves'] counts the moves the players have made
+    my_metrics.latencies holds the seconds taken by the most recent move
+      requests, from the request being read to its reply being written
+    my_metrics.lookups holds the seconds the most recent best-move lookups
+      waited in the queue, including the batched lookup itself
+    my_metrics.snapshot() sums them up as a dict that can be sent as JSON
+    """
+
+    def __init__ ( self, samples=10000 ):
+        self.started = time.perf_counter()
+        self.counters = collections.Counter()
+        self.latencies = collections.deque(maxlen=samples)
+        self.lookups = collections.deque(maxlen=samples)
+        self.batch_sizes = collections.deque(maxlen=samples)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+
+    def queued(self, change):
+        """Records lookups joining (a positive change) or leaving (a negative one) the queues"""
+        self.queue_depth += change
+        if self.queue_depth > self.max_queue_depth:
+            self.max_queue_depth = self.queue_depth
+
+    def percentiles(self, samples):
+        """Returns the 50th, 95th and 99th percentiles of latency samples in milliseconds"""
+        if len(samples) == 0:
+            return { 'p50': None, 'p95': None, 'p99': None }
+        p50, p95, p99 = np.percentile(np.array(samples) * 1000, (50, 95, 99)).tolist()
+        return { 'p50': p50, 'p95': p95, 'p99': p99 }
+
+    def snapshot(self):
+        uptime = time.perf_counter() - self.started
+        return { 'uptime': uptime,
+                 'counters': dict(self.counters),
+                 'moves_per_sec': self.counters['moves'] / uptime if uptime > 0 else 0.0,
+                 'queue_depth': self.queue_depth,
+                 'max_queue_depth': self.max_queue_depth,
+                 'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+                 'move_latency_ms': self.percentiles(self.latencies),
+                 'lookup_latency_ms': self.percentiles(self.lookups) }
+
+
+class MoveBatcher:
+    """
+    Answers best-move lookups for one player.  Lookups are queued, and every
+    lookup queued during one pass of the event loop is answered by a single
+    call to the player's policy (see DotsEval.player_policy), which for a
+    player with a Q-table is one vectorized lookup.  With a delay in seconds
+    the queue waits that long for more lookups before it is flushed.  Players
+    without a Q-table, such as a SearchPlayer, are asked one state at a time
+    inside the event loop, which blocks it while they think.
+    """
+
+    def __init__ ( self, player, metrics, max_batch=4096, delay=0.0, seed=None ):
+        self.policy = player_policy(player, seed)
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.delay = delay
+        self.bits = np.array(Dots.edge_masks(player.n, player.m)[0], dtype=np.int64)
+        self.pending = []
+        self.handle = None
+
+    async def best_move(self, state):
+        """Returns the player's move in an integer state once the batch it joined has been looked up"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((state, future, time.perf_counter()))
+        self.metrics.queued(1)
+        if self.handle is None:
+            self.handle = loop.call_later(self.delay, self.flush) if self.delay > 0 else loop.call_soon(self.flush)
+        return await future
+
+    def flush(self):
+        """Looks up the moves of up to max_batch queued states at once and hands them out"""
+        batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+        self.handle = asyncio.get_running_loop().call_soon(self.flush) if self.pending else None
+        self.metrics.queued(-len(batch))
+        self.metrics.batch_sizes.append(len(batch))
+        self.metrics.counters['batches'] += 1
+
+        states = np.array([ state for state, future, start in batch ], dtype=np.int64)
+        try:
+            moves = np.asarray(self.policy(states, (states[:, None] & self.bits) == 0)).tolist()
+        except Exception as error:
+            for state, future, start in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        now = time.perf_counter()
+        for (state, future, start), move in zip(batch, moves):
+            self.metrics.lookups.append(now - start)
+            if not future.done():
+                future.set_result(int(move))
+
+
+class Game:
+    """One match between a client and a player.  The client moves when board.turn == seat"""
+
+    def __init__ ( self, game_id, player, board, seat ):
+        self.id = game_id
+        self.player = player
+        self.board = board
+        self.seat = seat
+        self.lock = asyncio.Lock()
+
+    def scores(self):
+        """Returns the boxes taken by the client and by the player"""
+        scores = (self.board.score1, self.board.score2)
+        return [ scores[self.seat], scores[1 - self.seat] ]
+
+    def done(self):
+        return self.board.moves_remaining() == 0
+
+
+class MatchServer:
+    """
+    Serves matches against trained players to many clients at once over TCP,
+    with one JSON object per line each way.  Players are shared by every game
+    and only read.  Requests, each of which may carry an "id" that is echoed
+    in its reply:
+    {"op": "players"} lists the players and their board sizes
+    {"op": "new", "player": name, "first": true} starts a game; with
+      "first": false the player opens and its moves come in the reply
+    {"op": "move", "game": id, "move": k} plays the client's move k and then
+      the player's moves for as long as it holds the turn
+    {"op": "best_move", "player": name, "board": "0011..." or an integer}
+      asks for the player's move without a game
+    {"op": "close", "game": id} abandons a game
+    {"op": "metrics"} returns Metrics.snapshot()
+    Game replies hold the game id, the player's moves, the state as an
+    integer, the scores (client first) and whether the game is over; finished
+    games are dropped.  A request that cannot be served gets {"error": ...}.
+    Requests on one connection are served concurrently, but those for the
+    same game are served in order.
+    Example:
+    my_server = MatchServer({ '2x2': DotsPlayer.load('2x2.npq') })
+    await my_server.start('127.0.0.1', 8765) and await my_server.serve_forever()
+    """
+
+    def __init__ ( self, players, max_batch=4096, delay=0.0, seed=None ):
+        self.players = dict(players)
+        self.metrics = Metrics()
+        self.batchers = { name: MoveBatcher(player, self.metrics, max_batch, delay, seed)
+                          for name, player in self.players.items() }
+        self.games = {}
+        self.game_ids = itertools.count(1)
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8765):
+        """Starts listening; port 0 picks a free port.  Returns the asyncio server"""
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def handle(self, reader, writer):
+        """Serves one connection, answering each request line as soon as it is done.  The games the connection
+        started and left unfinished are dropped when it closes"""
+        self.metrics.counters['connections'] += 1
+        tasks = set()
+        owned = set()
+
+        async def answer(line, received):
+            request = {}
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('a request must be a JSON object')
+                reply = await self.dispatch(request, owned)
+            except Exception as error:
+                self.metrics.counters['errors'] += 1
+                reply = { 'error': str(error) }
+            if isinstance(request, dict) and 'id' in request:
+                reply['id'] = request['id']
+            if not writer.is_closing():
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+            if isinstance(request, dict) and request.get('op') == 'move':
+                self.metrics.latencies.append(time.perf_counter() - received)
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.metrics.counters['requests'] += 1
+                task = asyncio.create_task(answer(line, time.perf_counter()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            for game_id in owned:
+                if self.games.pop(game_id, None) is not None:
+                    self.metrics.counters['games_abandoned'] += 1
+            self.metrics.counters['connections_closed'] += 1
+            writer.close()
+
+    async def dispatch(self, request, owned=None):
+        """Serves one decoded request and returns its reply; the ids of games it starts are added to owned"""
+        op = request.get('op')
+
+        if op == 'move':
+            return await self.play(self.game(request), int(request['move']))
+        if op == 'new':
+            return await self.new_game(request.get('player'), request.get('first', True), owned)
+        if op == 'best_move':
+            player = self.player(request.get('player'))
+            board = request['board']
+            state = Dots.state_id(board)
+            if state < 0 or state >= 2**player.lines - 1:
+                raise ValueError('board is not an unfinished game')
+            return { 'move': await self.batchers[request['player']].best_move(state) }
+        if op == 'close':
+            self.games.pop(request.get('game'), None)
+            return { 'closed': request.get('game') }
+        if op == 'players':
+            return { 'players': { name: [player.n, player.m] for name, player in self.players.items() } }
+        if op == 'metrics':
+            snapshot = self.metrics.snapshot()
+            snapshot['games'] = len(self.games)
+            return snapshot
+        raise ValueError(f'unknown op {op!r}')
+
+    def player(self, name):
+        if name not in self.players:
+            raise ValueError(f'unknown player {name!r}')
+        return self.players[name]
+
+    def game(self, request):
+        if request.get('game') not in self.games:
+            raise ValueError(f"unknown game {request.get('game')!r}")
+        return self.games[request['game']]
+
+    async def new_game(self, name, first=True, owned=None):
+        player = self.player(name)
+        game = Game(next(self.game_ids), name, Dots.DotsBoard(player.n, player.m), 0 if first else 1)
+        self.games[game.id] = game
+        if owned is not None:
+            owned.add(game.id)
+        self.metrics.counters['games_started'] += 1
+        async with game.lock:
+            moves = await self.reply_moves(game)
+        return self.game_reply(game, moves)
+
+    async def play(self, game, move):
+        async with game.lock:
+            board = game.board
+            if game.done() or board.turn != game.seat:
+                raise ValueError('it is not the client\'s turn')
+            if not 0 <= move < board.lines or board.state & board.edge_bits[move]:
+                raise ValueError(f'move {move} is not legal')
+            board.play(move)
+            self.metrics.counters['client_moves'] += 1
+            moves = await self.reply_moves(game)
+        return self.game_reply(game, moves)
+
+    async def reply_moves(self, game):
+        """Plays the player's moves while it holds the turn and returns them"""
+        board = game.board
+        batcher = self.batchers[game.player]
+        moves = []
+        while not game.done() and board.turn != game.seat:
+            move = await batcher.best_move(board.state)
+            board.play(move)
+            moves.append(move)
+        self.metrics.counters['moves'] += len(moves)
+        return moves
+
+    def game_reply(self, game, moves):
+        done = game.done()
+        if done and self.games.pop(game.id, None) is not None:
+            self.metrics.counters['games_finished'] += 1
+        return { 'game': game.id, 'moves': moves, 'state': game.board.state, 'scores': game.scores(), 'done': done }
+
+
+async def load_test(host, port, player, clients=100, games=10, seed=None):
+    """
+    Opens clients connections to a MatchServer and plays games games against
+    player on each, choosing random legal moves, all connections at once.
+    Every connection waits for each reply before it sends its next request.
+    Returns a dict with the games and requests per second, the client-side
+    request latency percentiles in milliseconds and the server's metrics.
+    """
+    latencies = []
+    rng = random.Random(seed)
+    seeds = [ rng.getrandbits(32) for i in range(clients) ]
+
+    async def call(reader, writer, request):
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b'\n')
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply
+
+    async def client(seed):
+        moves = random.Random(seed)
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            n, m = (await call(reader, writer, { 'op': 'players' }))['players'][player]
+            edge_bits = Dots.edge_masks(n, m)[0]
+            for g in range(games):
+                reply = await call(reader, writer, { 'op': 'new', 'player': player, 'first': g % 2 == 0 })
+                while not reply['done']:
+                    legal = [ i for i, bit in enumerate(edge_bits) if not reply['state'] & bit ]
+                    reply = await call(reader, writer, { 'op': 'move', 'game': reply['game'], 'move': moves.choice(legal) })
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[ client(seed) for seed in seeds ])
+    seconds = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    server = await call(reader, writer, { 'op': 'metrics' })
+    writer.close()
+    await writer.wait_closed()
+
+    return { 'clients': clients,
+             'games': clients * games,
+             'seconds': seconds,
+             'games_per_sec': clients * games / seconds,
+             'requests_per_sec': len(latencies) / seconds,
+             'latency_ms': Metrics().percentiles(latencies),
+             'server': server }
+
+def load_players(checkpoints=(), solved=()):
+    """Loads players from 'name=path' checkpoint specs, memory-mapped read-only, and solves an exact player (see
+    DotsPlayer.solve) for every 'NxM' board size in solved, named after it"""
+    players = {}
+    for spec in checkpoints:
+        name, path = spec.split('=', 1)
+        players[name] = DotsPlayer.load(path, 'r')
+    for size in solved:
+        n, m = ( int(x) for x in size.lower().split('x') )
+        players[size] = DotsPlayer(n, m)
+        players[size].solve()
+    return players
+
+async def serve(args):
+    server = MatchServer(load_players(args.player, args.solved), args.max_batch, args.delay, args.seed)
+    await server.start(args.host, args.port)
+    print(f'serving {", ".join(server.players)} on {args.host}:{server.port}', flush=True)
+
+    if args.metrics_interval:
+        async def report():
+            while True:
+                await asyncio.sleep(args.metrics_interval)
+                print(json.dumps(server.metrics.snapshot()), flush=True)
+        asyncio.create_task(report())
+
+    await server.serve_forever()
+
+async def loadgen(args):
+    server = None
+    host, port, player = args.host, args.port, args.player
+    if args.local:
+        server = MatchServer(load_players(solved=[args.local]), args.max_batch, args.delay, args.seed)
+        await server.start(host, 0)
+        port, player = server.port, args.local
+
+    try:
+        result = await load_test(host, port, player, args.clients, args.games, args.seed)
+    finally:
+        if server is not None:
+            server.close()
+    print(json.dumps(result, indent=2))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python DotsServer.py', description='Dots and Boxes match server')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serving = commands.add_parser('serve', help='serve matches against players')
+    serving.add_argument('--player', nargs='*', default=[], help='players to load as name=checkpoint')
+    serving.add_argument('--solved', nargs='*', default=[], help='board sizes such as 2x2 to serve a solved player for')
+    serving.add_argument('--port', type=int, default=8765)
+    serving.add_argument('--metrics-interval', type=float, help='print the metrics every this many seconds')
+
+    loading = commands.add_parser('loadgen', help='play random games against a server and report the throughput')
+    loading.add_argument('--player', help='the player to play against')
+    loading.add_argument('--local', help='start a server with a solved player for this board size, such as 2x2')
+    loading.add_argument('--port', type=int, default=8765)
+    loading.add_argument('--clients', type=int, default=100, help='concurrent connections')
+    loading.add_argument('--games', type=int, default=10, help='games per connection')
+
+    for command in (serving, loading):
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--max-batch', type=int, default=4096, help='most lookups answered by one batch')
+        command.add_argument('--delay', type=float, default=0.0, help='seconds a batch waits for more lookups')
+        command.add_argument('--seed', type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == 'loadgen' and not (args.player or args.local):
+        parser.error('loadgen needs --player or --local')
+    asyncio.run(serve(args) if args.command == 'serve' else loadgen(args))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import numpy as np
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import os
+import sys
+import time
+import weakref
+
+OWN_TRACKER = {}
+
+class SharedTable:
+    """
+    Moves the arrays of a Q-table (see QTable.shared) into shared memory blocks
+    so that worker processes can attach to them instead of being sent a pickled
+    copy.  The table keeps working in this process on views of the blocks, so
+    learning updates are seen by the workers without copying.  The blocks are
+    released by close() or when this object is garbage collected.
+    """
+
+    def __init__ ( self, table ):
+        self.table = table
+        self.blocks = {}
+        self.views = {}
+
+        for name in table.shared:
+            array = getattr(table, name)
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            view[...] = array
+            setattr(table, name, view)
+            self.blocks[name] = block
+            self.views[name] = view
+
+        self.finalizer = weakref.finalize(self, release, list(self.blocks.values()), True)
+
+    def stale(self):
+        """Returns True if the table has replaced any of its arrays since they were shared, as a LazyQTable does when
+        it grows, so that the workers would no longer see its updates"""
+        return any( not np.may_share_memory(getattr(self.table, name), view) for name, view in self.views.items() )
+
+    def spec(self):
+        """Returns what a worker needs to attach to the table: its class, board size and the block name, shape and
+        dtype of every array"""
+        arrays = {}
+        for name, block in self.blocks.items():
+            array = getattr(self.table, name)
+            arrays[name] = (block.name, array.shape, array.dtype.str)
+        return (type(self.table), self.table.n, self.table.m, arrays)
+
+    def close(self):
+        """Copies the arrays back into private memory and releases the shared blocks"""
+        for name in self.blocks:
+            setattr(self.table, name, getattr(self.table, name).copy())
+        self.views = {}
+        self.finalizer()
+
+
+def release(blocks, unlink):
+    """Closes shared memory blocks, and unlinks them if this process owns them.  A block that still has views in use
+    stays mapped until those views are gone"""
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            pass
+        if unlink:
+            block.unlink()
+
+def open_block(name):
+    """Attaches to an existing shared memory block.  The creating process owns the block, so it must not be registered
+    with a resource tracker started by a worker, which would unlink it when the worker exits"""
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+
+    # CPython 3.8 to 3.12 register every attached block with the resource tracker.  A worker that inherited the
+    # creator's tracker (fork) shares its registrations and must leave them alone; one that started its own tracker
+    # must unregister the block.  Telling the two apart needs the tracker's private _fd; if a build lacks it, the
+    # block is always unregistered, which at worst leaves cleanup after a crash of the creator to the OS.
+    pid = os.getpid()
+    if pid not in OWN_TRACKER:
+        tracker = getattr(resource_tracker, '_resource_tracker', None)
+        OWN_TRACKER[pid] = getattr(tracker, '_fd', None) is None
+    block = SharedMemory(name=name)
+    if OWN_TRACKER[pid]:
+        resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+def attach(spec):
+    """Rebuilds a read-only table from SharedTable.spec() in a worker process.  Returns the table and its blocks,
+    which have to be released once the table is no longer used"""
+    cls, n, m, specs = spec
+    blocks = []
+    arrays = {}
+
+    for name, (block_name, shape, dtype) in specs.items():
+        block = open_block(block_name)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+        blocks.append(block)
+
+    return cls.from_arrays(n, m, arrays), blocks
+
+def collect_experiences(task):
+    """Worker for DotsPlayer.generate_multiple_experiences(): attaches to the shared table and writes count sampled
+    experiences into rows start to start+count of the shared output array.  Returns the seconds spent sampling"""
+    spec, output_name, num_games, start, count, seed = task
+    table, blocks = attach(spec)
+    output = open_block(output_name)
+
+    try:
+        experiences = np.ndarray((num_games, 5), dtype=np.int64, buffer=output.buf)
+        sampling = time.perf_counter()
+        experiences[start:start + count] = table.sample_experiences(count, np.random.default_rng(seed))
+        seconds = time.perf_counter() - sampling
+        del experiences, table
+    finally:
+        release(blocks + [output], False)
+
+    return seconds
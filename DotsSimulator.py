@@ -0,0 +1,147 @@
+import DotsBoard as Dots
+import numpy as np
+
+class BatchSimulator:
+    """
+    Plays many nxm Dots-and-Boxes games at once with array operations instead
+    of one DotsBoard per game.  Each game is an integer bitboard in the
+    encoding of DotsBoard.state, so sim.states[i] is the row of game i in a
+    Q-table.  The number of drawn sides of every box is kept up to date, so a
+    move costs a few array operations for the whole batch.  Example:
+    sim = BatchSimulator(3, 3, 10000, seed=0)
+    sim.legal_mask() is a (games, lines) bool array of the moves left
+    sim.step(actions) plays one move in every game (-1 to skip a game) and
+      returns the boxes it completed; completing a box keeps the turn
+    sim.turn, sim.scores and sim.done hold whose turn it is (0 or 1), the boxes
+      of each player and which games are over
+    sim.rollout() plays every game to the end with random moves or policies
+    Boards up to 62 edges (5x5) fit the int64 bitboards.
+    """
+
+    def __init__ ( self, n, m, num_games, seed=None ):
+        shape = Dots.geometry(n, m)
+        edge_bits, box_masks = shape.edge_bits, shape.box_masks
+        self.n = n
+        self.m = m
+        self.lines = len(edge_bits)
+        self.num_games = num_games
+        self.num_boxes = len(box_masks)
+        self.rng = np.random.default_rng(seed)
+
+        if self.lines > 62:
+            raise ValueError(f'{n}x{m} boards do not fit in int64 bitboards')
+
+        self.bits = np.array(edge_bits, dtype=np.int64)
+        self.box_of_edge = np.full((self.lines, 2), self.num_boxes, dtype=np.intp)
+        for move, boxes in enumerate(shape.edge_box_indices):
+            self.box_of_edge[move, :len(boxes)] = boxes
+
+        self.reset()
+
+    def reset(self, games=None):
+        """Starts new games, in every slot or in the slots selected by an index or bool array"""
+        if games is None:
+            self.states = np.zeros(self.num_games, dtype=np.int64)
+            self.sides = np.zeros((self.num_games, self.num_boxes + 1), dtype=np.int8)
+            self.turn = np.zeros(self.num_games, dtype=np.int8)
+            self.scores = np.zeros((self.num_games, 2), dtype=np.int16)
+            self.moves_left = np.full(self.num_games, self.lines, dtype=np.int16)
+            self.done = np.zeros(self.num_games, dtype=bool)
+        else:
+            self.states[games] = 0
+            self.sides[games] = 0
+            self.turn[games] = 0
+            self.scores[games] = 0
+            self.moves_left[games] = self.lines
+            self.done[games] = False
+
+    def legal_mask(self, states=None):
+        """Returns a (games, lines) bool array of the moves not played yet, for the current games or for an array
+        of states"""
+        states = self.states if states is None else np.asarray(states, dtype=np.int64)
+        return (states[:, None] & self.bits) == 0
+
+    def random_actions(self, legal):
+        """Picks a random legal move in every row of a legal move mask, -1 where there is none"""
+        choice = np.where(legal, self.rng.random(legal.shape), -1).argmax(axis=1)
+        return np.where(legal.any(axis=1), choice, -1)
+
+    def step(self, actions):
+        """
+        Plays actions[i] in game i, skipping games that are over and those
+        given -1.  Returns an int8 array of the boxes each move completed.
+        Playing an edge that is already drawn raises a ValueError.
+        """
+        actions = np.asarray(actions, dtype=np.intp)
+        games = np.flatnonzero((actions >= 0) & ~self.done)
+        moves = actions[games]
+        bits = self.bits[moves]
+
+        if np.any(self.states[games] & bits):
+            raise ValueError('illegal move: edge already played')
+
+        self.states[games] |= bits
+        boxes = self.box_of_edge[moves]
+        self.sides[games[:, None], boxes] += 1
+        completed = ((self.sides[games[:, None], boxes] == 4) & (boxes < self.num_boxes)).sum(axis=1).astype(np.int8)
+        self.sides[games, self.num_boxes] = 0
+
+        turn = self.turn[games]
+        self.scores[games, turn] += completed
+        self.turn[games] = np.where(completed > 0, turn, 1 - turn)
+        self.moves_left[games] -= 1
+        self.done[games] = self.moves_left[games] == 0
+
+        rewards = np.zeros(self.num_games, dtype=np.int8)
+        rewards[games] = completed
+        return rewards
+
+    def actions(self, policies):
+        """Chooses the next move of every unfinished game with the policy of the player to move.  policies holds one
+        policy per player: None plays randomly, anything else is called with the states and legal move mask of that
+        player's games and returns their moves"""
+        actions = np.full(self.num_games, -1, dtype=np.intp)
+
+        for player, policy in enumerate(policies):
+            games = np.flatnonzero((self.turn == player) & ~self.done)
+            if len(games) == 0:
+                continue
+            legal = self.legal_mask(self.states[games])
+            actions[games] = self.random_actions(legal) if policy is None else policy(self.states[games], legal)
+
+        return actions
+
+    def rollout(self, policies=(None, None), record=False):
+        """
+        Plays every game to the end.  Returns the final scores, and with
+        record=True also an int64 array with one (state, move, new_state,
+        reward) row per move played.
+        """
+        played = []
+
+        while not self.done.all():
+            before = self.states.copy()
+            actions = self.actions(policies)
+            rewards = self.step(actions)
+            if record:
+                games = np.flatnonzero(actions >= 0)
+                played.append(np.stack([before[games], actions[games], self.states[games], rewards[games]], axis=1))
+
+        if record:
+            return self.scores, np.concatenate(played) if played else np.empty((0, 4), dtype=np.int64)
+        return self.scores
+
+    def results(self):
+        """Returns 1, 0 or -1 for every game as player one won, drew or lost it"""
+        return np.sign(self.scores[:, 0].astype(np.int32) - self.scores[:, 1])
+
+
+class TablePolicy:
+    """A policy for BatchSimulator that plays the best move of a QTable or CanonicalQTable, ties broken at random"""
+
+    def __init__ ( self, table, seed=None ):
+        self.table = table
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, states, legal):
+        return self.table.best_moves(states, self.rng)
@@ -0,0 +1,61 @@
+from DotsQTable import move_tables
+import numpy as np
+
+def solve(table, gamma=1.0):
+    """
+    Fills table.values (a QTable or CanonicalQTable) with the exact Q-values of
+    every (state, move) pair, the values the learners converge to.  A move that
+    completes a box keeps the turn, so its value is the reward plus gamma times
+    the value of the next state; any other move hands the turn over, so it is
+    the reward minus gamma times that value.  The value of a state is the best
+    of its moves, and 0 once every edge is played.
+    Every move adds an edge, so the states are swept in decreasing order of
+    played edges and each value is final the first time it is computed.  The
+    sweep needs one float32 per state besides the table.  Illegal moves are left
+    at 0, as build() leaves them.  Returns table.values.
+    """
+    n, m, lines = table.n, table.m, table.lines
+    played = np.bitwise_count(np.arange(2**lines, dtype=np.int64)).astype(np.int8)
+    order = np.argsort(played, kind='stable')
+    layers = np.concatenate([[0], np.cumsum(np.bincount(played, minlength=lines+1))])
+    del played
+
+    state_values = np.zeros(2**lines, dtype=np.float32)
+    moves = np.arange(lines)
+    chunk = 2**18
+
+    for k in range(lines - 1, -1, -1):
+        for start in range(layers[k], layers[k+1], chunk):
+            states = order[start:min(start + chunk, layers[k+1])]
+            transitions, rewards = move_tables(n, m, states)
+            legal = transitions >= 0
+            following = state_values[np.where(legal, transitions, 0)]
+            sign = np.where(rewards > 0, gamma, -gamma)
+            values = np.where(legal, rewards + sign * following, 0).astype(np.float32)
+            state_values[states] = np.where(legal, values, -np.inf).max(axis=1)
+
+            rows, columns = table.locate_batch(states[:, None], moves)
+            table.values[rows, columns] = values
+
+    return table.values
+
+def compare(table, exact):
+    """
+    Measures a learned table against exact values of the same layout, as made by
+    solve() on a table of the same kind.  Only legal moves are compared.
+    Returns a dict with the largest and mean absolute error of the Q-values and
+    the fraction of unfinished states where the table's best move is optimal.
+    """
+    legal = np.asarray(table.transitions) >= 0
+    values = np.asarray(table.values)
+    exact = np.asarray(exact)
+    errors = np.abs(values - exact)[legal]
+
+    playing = legal.any(axis=1)
+    chosen = np.where(legal, values, -np.inf)[playing].argmax(axis=1)
+    best = np.where(legal, exact, -np.inf)[playing]
+    optimal = best[np.arange(len(chosen)), chosen] == best.max(axis=1)
+
+    return { 'max_error': float(errors.max()) if len(errors) else 0.0,
+             'mean_error': float(errors.mean()) if len(errors) else 0.0,
+             'optimal_moves': float(optimal.mean()) if len(optimal) else 1.0 }
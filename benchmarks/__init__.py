@@ -0,0 +1,20 @@
+"""
+Benchmarks of the board engine, table construction and the learners.  Run
+them from the repository root with
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --baseline results.json --output new.json
+
+The second form compares the new results against the stored ones and exits
+with status 1 if any workload got slower than the threshold allows.
+
+The reference results live in benchmarks/baseline.json; its 'meta' entry
+records the machine, versions, revision and notes of the run.  Numbers are
+only comparable on the same machine, so compare against it there, or first
+refresh it on an otherwise idle machine with
+
+    python -m benchmarks --output benchmarks/baseline.json --notes "..."
+
+and commit it together with the change that moved the numbers.
+"""
+from benchmarks.suite import SIZES, WORKLOADS, workload, run, compare
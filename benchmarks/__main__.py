@@ -0,0 +1,45 @@
+from benchmarks.suite import SIZES, run, compare
+import argparse
+import json
+import sys
+
+def parse_size(text):
+    n, m = text.lower().split('x')
+    return int(n), int(m)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Dots and Boxes benchmarks')
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=list(SIZES), help='board sizes such as 2x2')
+    parser.add_argument('--only', nargs='+', help='run the workloads whose name starts with one of these')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per workload, the best is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results stored in this JSON file')
+    parser.add_argument('--notes', help='free text stored with the results, such as what the machine was doing')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change reported as a difference')
+    args = parser.parse_args(argv)
+
+    def log(entry):
+        memory = f"  peak {entry['peak_bytes'] / 2**20:8.2f} MiB" if 'peak_bytes' in entry else ''
+        print(f"{entry['name']:40} {entry['size']:>4}  {entry['value']:14.6g} {entry['metric']}{memory}", flush=True)
+
+    results = run(args.sizes, args.seed, not args.no_memory, args.only, args.repeat, log, args.notes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline, args.threshold)
+        print()
+        for row in comparison:
+            print(f"{row['name']:40} {row['size']:>4}  x{row['ratio']:6.2f}  {row['status']}")
+        if any(row['status'] == 'slower' for row in comparison):
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import DotsBoard as Dots
+from DotsPlayer import DotsPlayer
+from DotsSimulator import BatchSimulator
+import numpy as np
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+SIZES = ((1, 1), (1, 2), (2, 2), (1, 3))
+WORKLOADS = []
+
+def workload(name, metric, higher_is_better=True):
+    """Registers a benchmark.  The function takes (n, m) and returns (amount of work, seconds), or None when the
+    workload does not apply to that board size; the result is reported as amount / seconds, or as seconds for
+    metrics where lower is better"""
+    def register(function):
+        WORKLOADS.append((name, metric, higher_is_better, function))
+        return function
+    return register
+
+def timed(function, *args):
+    """Returns the result of a call and the seconds it took"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+@workload('board.play', 'moves_per_sec')
+def board_play(n, m):
+    """Random games through DotsBoard, asking for the legal moves and the score after every move"""
+    games = max(1, 20000 // (m + ((2*m)+1)*n))
+    moves = 0
+    start = time.perf_counter()
+    for g in range(games):
+        board = Dots.DotsBoard(n, m)
+        while True:
+            legal = board.legal_moves()
+            if not legal:
+                break
+            board.play(random.choice(legal))
+            board.score()
+            moves += 1
+    return moves, time.perf_counter() - start
+
+@workload('board.play_undo', 'moves_per_sec')
+def board_play_undo(n, m):
+    """Random games played to the end and taken back move by move on a single DotsBoard, as a search walks the tree"""
+    games = max(1, 20000 // (m + ((2*m)+1)*n))
+    board = Dots.DotsBoard(n, m)
+    moves = 0
+    start = time.perf_counter()
+    for g in range(games):
+        while True:
+            legal = board.legal_moves()
+            if not legal:
+                break
+            board.play(random.choice(legal))
+            moves += 1
+        while board.undo() is not None:
+            moves += 1
+    return moves, time.perf_counter() - start
+
+@workload('simulator.rollout', 'moves_per_sec')
+def simulator_rollout(n, m):
+    """Random games on the batched simulator"""
+    sim = BatchSimulator(n, m, 20000, seed=random.getrandbits(32))
+    result, seconds = timed(sim.rollout)
+    return 20000 * sim.lines, seconds
+
+@workload('player.init', 'states_per_sec')
+def player_init(n, m):
+    """DotsPlayer construction, which builds the transition and reward tables"""
+    player, seconds = timed(DotsPlayer, n, m)
+    return player.table.num_states, seconds
+
+@workload('player.init_canonical', 'states_per_sec')
+def player_init_canonical(n, m):
+    """DotsPlayer construction with a canonical table"""
+    player, seconds = timed(DotsPlayer, n, m, True)
+    return player.table.num_states, seconds
+
+@workload('player.solve', 'states_per_sec')
+def player_solve(n, m):
+    """The exact retrograde solver"""
+    player = DotsPlayer(n, m)
+    result, seconds = timed(player.solve)
+    return player.table.num_states, seconds
+
+@workload('learn.learn_from_games', 'updates_per_sec')
+def learn_from_games(n, m):
+    player = DotsPlayer(n, m)
+    result, seconds = timed(player.learn_from_games, 5000)
+    return 5000, seconds
+
+@workload('learn.learn_from_games_symm', 'updates_per_sec')
+def learn_from_games_symm(n, m):
+    player = DotsPlayer(n, m)
+    result, seconds = timed(player.learn_from_games_symm, 5000)
+    return 5000 * len(player.symmetries), seconds
+
+@workload('learn.learn_from_batch', 'updates_per_sec')
+def learn_from_batch(n, m):
+    player = DotsPlayer(n, m)
+    experiences = player.table.sample_experiences(50000, np.random.default_rng(random.getrandbits(32)))
+    result, seconds = timed(player.learn_from_games_mp, experiences)
+    return len(experiences), seconds
+
+@workload('learn.learn_from_batch_lazy', 'updates_per_sec')
+def learn_from_batch_lazy(n, m):
+    """The same batch as learn.learn_from_batch on a LazyQTable, which makes its rows as the batch reaches them"""
+    player = DotsPlayer(n, m, lazy=True)
+    experiences = DotsPlayer(n, m).table.sample_experiences(50000, np.random.default_rng(random.getrandbits(32)))
+    result, seconds = timed(player.learn_from_games_mp, experiences)
+    return len(experiences), seconds
+
+@workload('learn.learn_from_batch_symm', 'updates_per_sec')
+def learn_from_batch_symm(n, m):
+    player = DotsPlayer(n, m)
+    experiences = player.table.sample_experiences(50000, np.random.default_rng(random.getrandbits(32)))
+    result, seconds = timed(player.learn_from_games_mp_symm, experiences)
+    return len(experiences) * len(player.symmetries), seconds
+
+@workload('learn.prioritized_sweeping', 'updates_per_sec')
+def prioritized_sweeping(n, m):
+    player = DotsPlayer(n, m)
+    return timed(player.prioritized_sweeping)
+
+def convergence(method):
+    """Makes a workload timing one of the is_fully_trained* methods from a fresh player to convergence"""
+    def run(n, m):
+        player = DotsPlayer(n, m)
+        count, seconds = timed(getattr(player, method))
+        return count, seconds
+    return run
+
+for method in ('is_fully_trained', 'is_fully_trained_symm', 'is_fully_trained_sweeping', 'is_fully_trained_prioritized'):
+    workload('converge.' + method, 'seconds', higher_is_better=False)(convergence(method))
+
+def git_revision():
+    """Returns the commit the benchmarks run on, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes=SIZES, seed=0, memory=True, only=None, repeat=3, log=None, notes=None):
+    """
+    Runs every registered workload (or those whose name starts with one of
+    only) on every board size and returns a dict ready to be written as JSON.
+    Each workload is seeded with seed before every run, so the work done is
+    the same from one run to the next.  The best of repeat runs is reported,
+    the convergence workloads run once.  With memory=True every workload runs
+    once more under tracemalloc to record its peak allocation.  notes is
+    stored as is with the machine description, to say what the run was for.
+    """
+    results = []
+
+    for name, metric, higher_is_better, function in WORKLOADS:
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        for n, m in sizes:
+            runs = []
+            for r in range(1 if metric == 'seconds' else repeat):
+                random.seed(seed)
+                runs.append(function(n, m))
+            work, seconds = min(runs, key=lambda run: run[1])
+            value = seconds if metric == 'seconds' else work / seconds
+
+            entry = { 'name': name, 'size': f'{n}x{m}', 'metric': metric, 'value': value,
+                      'higher_is_better': higher_is_better, 'work': work, 'seconds': seconds }
+            if memory:
+                random.seed(seed)
+                tracemalloc.start()
+                function(n, m)
+                entry['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            results.append(entry)
+            if log is not None:
+                log(entry)
+
+    return { 'meta': { 'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                       'processor': platform.processor(), 'cpus': os.cpu_count(), 'platform': platform.platform(), 'revision': git_revision(), 'seed': seed,
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'notes': notes },
+             'results': results }
+
+def compare(current, baseline, threshold=0.1):
+    """
+    Compares two outputs of run() workload by workload.  Returns one dict per
+    workload present in both with the ratio of the current value to the
+    baseline and its status: 'faster' or 'slower' when the change, in the
+    direction that matters for the metric, is beyond threshold (a fraction),
+    'same' otherwise.  Peak memory is compared the same way when both have it.
+    """
+    stored = { (entry['name'], entry['size']): entry for entry in baseline['results'] }
+    comparison = []
+
+    for entry in current['results']:
+        before = stored.get((entry['name'], entry['size']))
+        if before is None or before['value'] == 0:
+            continue
+        ratio = entry['value'] / before['value']
+        gain = ratio if entry['higher_is_better'] else 1 / ratio
+        status = 'faster' if gain > 1 + threshold else 'slower' if gain < 1 - threshold else 'same'
+        row = { 'name': entry['name'], 'size': entry['size'], 'metric': entry['metric'], 'baseline': before['value'],
+                'value': entry['value'], 'ratio': ratio, 'status': status }
+        if 'peak_bytes' in entry and before.get('peak_bytes'):
+            row['memory_ratio'] = entry['peak_bytes'] / before['peak_bytes']
+            row['memory_status'] = ('larger' if row['memory_ratio'] > 1 + threshold
+                                    else 'smaller' if row['memory_ratio'] < 1 - threshold else 'same')
+        comparison.append(row)
+
+    return comparison
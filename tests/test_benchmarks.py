@@ -0,0 +1,40 @@
+from benchmarks.__main__ import main
+from benchmarks.suite import compare, run
+import json
+
+def result(name, value, higher_is_better=True, peak_bytes=None):
+    entry = { 'name': name, 'size': '2x2', 'metric': 'per_sec' if higher_is_better else 'seconds', 'value': value,
+              'higher_is_better': higher_is_better }
+    if peak_bytes is not None:
+        entry['peak_bytes'] = peak_bytes
+    return entry
+
+def test_compare_reports_changes_in_the_direction_that_matters():
+    baseline = { 'results': [ result('fast', 100), result('slow', 100), result('same', 100),
+                              result('time', 2.0, False), result('gone', 1), result('zero', 0) ] }
+    current = { 'results': [ result('fast', 150), result('slow', 50), result('same', 105),
+                             result('time', 1.0, False), result('new', 1), result('zero', 1) ] }
+    rows = { row['name']: row for row in compare(current, baseline) }
+    assert set(rows) == { 'fast', 'slow', 'same', 'time' }
+    assert { name: row['status'] for name, row in rows.items() } == \
+        { 'fast': 'faster', 'slow': 'slower', 'same': 'same', 'time': 'faster' }
+    assert rows['slow']['ratio'] == 0.5
+    assert compare(current, baseline, threshold=0.6)[1]['status'] == 'same'
+
+def test_compare_reports_memory_when_both_runs_have_it():
+    rows = compare({ 'results': [ result('a', 1, peak_bytes=300) ] }, { 'results': [ result('a', 1, peak_bytes=100) ] })
+    assert rows[0]['memory_ratio'] == 3
+    assert rows[0]['memory_status'] == 'larger'
+    assert 'memory_ratio' not in compare({ 'results': [ result('a', 1) ] }, { 'results': [ result('a', 1) ] })[0]
+
+def test_main_exits_with_1_on_a_slowdown(tmp_path):
+    results = run([(1, 1)], only=['board.play_undo'], repeat=1, memory=False, notes='test')
+    assert [ entry['name'] for entry in results['results'] ] == ['board.play_undo']
+    assert results['meta']['notes'] == 'test'
+
+    path = tmp_path / 'baseline.json'
+    slow = dict(results['results'][0], value=results['results'][0]['value'] / 100)
+    path.write_text(json.dumps({ 'meta': results['meta'], 'results': [slow] }))
+    assert main(['--sizes', '1x1', '--only', 'board.play_undo', '--repeat', '1', '--no-memory', '--baseline', str(path)]) == 0
+    path.write_text(json.dumps({ 'meta': results['meta'], 'results': [dict(slow, value=slow['value'] * 10**6)] }))
+    assert main(['--sizes', '1x1', '--only', 'board.play_undo', '--repeat', '1', '--no-memory', '--baseline', str(path)]) == 1
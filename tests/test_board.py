@@ -0,0 +1,103 @@
+import DotsBoard as Dots
+import numpy as np
+import random
+
+def snapshot(board):
+    return board.state, board.score1, board.score2, board.turn, board.boxes, board.order(), board.legal_moves()
+
+def random_game(board, rng):
+    while board.legal_moves():
+        board.play(rng.choice(board.legal_moves()))
+
+def test_play_sets_the_bit_of_the_edge():
+    board = Dots.DotsBoard(2, 2)
+    board.play(3)
+    assert board.show_board() == '000100000000'
+    assert board.state == 1 << (board.lines - 1 - 3)
+    assert 3 not in board.legal_moves()
+
+def test_playing_an_edge_twice_does_nothing():
+    board = Dots.DotsBoard(2, 2)
+    board.play(3)
+    before = snapshot(board)
+    board.play(3)
+    assert snapshot(board) == before
+
+def test_completing_a_box_scores_and_keeps_the_turn():
+    board = Dots.DotsBoard(1, 1)
+    for move in (0, 1, 2):
+        board.play(move)
+    turn = board.whose_turn()
+    board.play(3)
+    assert board.score() == 1
+    assert board.whose_turn() == turn
+    assert board.score1 + board.score2 == 1
+
+def test_scores_add_up_to_the_boxes():
+    rng = random.Random(0)
+    for n, m in ((1, 1), (1, 3), (2, 2), (3, 3)):
+        board = Dots.DotsBoard(n, m)
+        random_game(board, rng)
+        assert board.score1 + board.score2 == board.score() == n * m
+        assert board.moves_remaining() == 0
+
+def test_undo_takes_back_every_move():
+    rng = random.Random(1)
+    board = Dots.DotsBoard(2, 3)
+    history = [snapshot(board)]
+    while board.legal_moves():
+        board.play(rng.choice(board.legal_moves()))
+        history.append(snapshot(board))
+
+    while history:
+        assert snapshot(board) == history.pop()
+        board.undo()
+    assert board.undo() is None
+
+def test_copy_is_independent_of_the_original():
+    rng = random.Random(2)
+    board = Dots.DotsBoard(2, 2)
+    for k in range(4):
+        board.play(rng.choice(board.legal_moves()))
+    before = snapshot(board)
+    copy = board.copy()
+    assert snapshot(copy) == before
+
+    random_game(copy, rng)
+    assert snapshot(board) == before
+    board.undo()
+    assert snapshot(copy)[0] == (1 << board.lines) - 1
+    assert len(copy.order()) == board.lines
+
+def test_undo_on_a_copy_leaves_the_original_alone():
+    board = Dots.DotsBoard(1, 2)
+    for move in (0, 3, 5):
+        board.play(move)
+    before = snapshot(board)
+    copy = board.copy()
+    copy.undo()
+    copy.undo()
+    assert snapshot(board) == before
+    assert copy.order() == [0]
+
+def test_render_draws_the_played_edges():
+    shape = Dots.geometry(1, 1)
+    assert shape.render(0b1111) == '+---+\n|   |\n+---+\n'
+    assert shape.render(0b1001) == '+---+\n     \n+---+\n'
+    assert shape.render(0) == '+   +\n     \n+   +\n'
+
+def test_render_batch_matches_render():
+    for n, m in ((1, 1), (2, 2), (2, 3)):
+        shape = Dots.geometry(n, m)
+        states = np.random.default_rng(0).integers(0, 1 << len(shape.edge_bits), 200)
+        assert shape.render_batch(states) == [ shape.render(state) for state in states.tolist() ]
+    assert Dots.geometry(2, 2).render_batch([]) == []
+
+def test_geometry_indexes_agree():
+    shape = Dots.geometry(2, 3)
+    assert Dots.geometry(2, 3) is shape is Dots.DotsBoard(2, 3).geometry
+    for box, edges in enumerate(shape.box_edges):
+        assert shape.box_masks[box] == sum(shape.edge_bits[edge] for edge in edges)
+        for edge in edges:
+            assert box in shape.edge_box_indices[edge]
+    assert sorted(len(boxes) for boxes in shape.edge_box_indices).count(2) == 7
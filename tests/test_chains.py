@@ -0,0 +1,39 @@
+from DotsChains import ChainAnalyzer
+from DotsPlayer import DotsPlayer
+import numpy as np
+import pytest
+
+@pytest.mark.parametrize('n, m', [(1, 2), (1, 3), (2, 2)])
+def test_endgame_values_match_the_solver(n, m):
+    player = DotsPlayer(n, m)
+    values = player.solve()
+    analyzer = ChainAnalyzer(n, m)
+    checked = 0
+
+    for state in range(player.table.num_states):
+        position = analyzer.analyze(state)
+        value = position.value()
+        if value is None:
+            continue
+        legal = player.legal_moves(state)
+        exact = max(values[state, legal]) if legal else 0
+        assert value == exact, format(state, 'b').zfill(player.lines)
+
+        move = position.optimal_move()
+        if legal:
+            assert values[state, move] == exact
+        checked += 1
+    assert checked > 0
+
+def test_play_keeps_the_decomposition_up_to_date():
+    analyzer = ChainAnalyzer(2, 2)
+    rng = np.random.default_rng(0)
+    for game in range(20):
+        position = analyzer.analyze(0)
+        state = 0
+        for move in rng.permutation(analyzer.lines).tolist():
+            position.play(move)
+            state |= analyzer.edge_bits[move]
+            fresh = analyzer.analyze(state)
+            assert sorted(map(repr, position.components)) == sorted(map(repr, fresh.components))
+            assert position.value() == fresh.value()
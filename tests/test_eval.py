@@ -0,0 +1,34 @@
+from DotsEval import MovePolicy, evaluate, exact_policy, player_policy
+from DotsPlayer import DotsPlayer
+from DotsSearch import SearchPlayer
+from DotsSimulator import TablePolicy
+import pytest
+
+def test_perfect_players_score_the_value_of_the_game():
+    exact = DotsPlayer(2, 2)
+    value = exact.solve()[0].max()
+    first = evaluate(2, 2, exact_policy(2, 2), exact_policy(2, 2), num_games=50, seed=0, seats='first')
+    second = evaluate(2, 2, exact_policy(2, 2), exact_policy(2, 2), num_games=50, seed=0, seats='second')
+    assert first['mean_margin'] == value
+    assert second['mean_margin'] == -value
+
+def test_results_are_seeded_and_consistent():
+    results = evaluate(2, 2, exact_policy(2, 2, seed=1), None, num_games=501, seed=3)
+    assert results == evaluate(2, 2, exact_policy(2, 2, seed=2), None, num_games=501, seed=3)
+    assert results['mean_margin'] > 0
+    assert results['win_rate'] + results['draw_rate'] + results['loss_rate'] == pytest.approx(1)
+    for name in ('win', 'draw', 'loss'):
+        low, high = results[name + '_interval']
+        assert low <= results[name + '_rate'] <= high
+    low, high = results['return_interval']
+    assert low <= results['mean_return'] <= high
+
+    with pytest.raises(ValueError):
+        evaluate(2, 2, None, num_games=10, seats='both')
+
+def test_player_policies():
+    assert isinstance(player_policy(DotsPlayer(1, 2)), TablePolicy)
+    search = SearchPlayer(1, 2, time_limit=None)
+    policy = player_policy(search)
+    assert isinstance(policy, MovePolicy)
+    assert evaluate(1, 2, policy, None, num_games=20, seed=0)['games'] == 20
@@ -0,0 +1,51 @@
+from DotsInstrument import CSVSink, Instrumentation, MemorySink, NullInstrumentation
+from DotsPlayer import DotsPlayer
+import csv
+import time
+
+def test_flush_sends_timers_and_counters_to_every_sink(tmp_path):
+    memory = MemorySink()
+    path = tmp_path / 'timings.csv'
+    instrumentation = Instrumentation([memory, CSVSink(path)])
+    with instrumentation.phase('update'):
+        time.sleep(0.01)
+    instrumentation.add_time('update', 1.0, 3)
+    instrumentation.count('updates_applied', 10)
+    instrumentation.count('updates_applied')
+    records = instrumentation.flush('batch')
+
+    assert { (record['kind'], record['name']) for record in records } == { ('timer', 'update'), ('counter', 'updates_applied') }
+    assert memory.totals()['update'] >= 1.01
+    assert memory.totals('counter') == { 'updates_applied': 11 }
+    assert [ record['calls'] for record in records if record['kind'] == 'timer' ] == [4]
+    assert instrumentation.flush('empty') == []
+
+    instrumentation.count('updates_applied', 5)
+    instrumentation.flush('again')
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [ (row['label'], row['name']) for row in rows ] == [('batch', 'update'), ('batch', 'updates_applied'),
+                                                             ('again', 'updates_applied')]
+
+def test_the_profiler_samples_the_training_thread():
+    memory = MemorySink()
+    instrumentation = Instrumentation([memory], profile=True, interval=0.001)
+    with instrumentation:
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+    records = instrumentation.flush()
+    profile = [ record for record in records if record['kind'] == 'profile' ]
+    assert profile and any('test_instrument.py' in record['name'] for record in profile)
+    assert sum(record['value'] for record in profile) <= 1 + 1e-9
+
+def test_player_hooks_count_collapsed_cells():
+    player = DotsPlayer(1, 2)
+    player.instrumentation = Instrumentation([MemorySink()])
+    player.learn_from_batch([0, 0, 0], [1, 1, 2], [player.table.transition(0, 1)] * 2 + [player.table.transition(0, 2)],
+                            [0, 0, 0], [-1, -1, -1])
+    counters = player.instrumentation.counters
+    assert counters == { 'updates_applied': 2, 'cells_collapsed': 1 }
+    assert 'update' in player.instrumentation.timers
+
+    assert NullInstrumentation().flush() == []
@@ -0,0 +1,114 @@
+from DotsPlayer import ConvergenceTracker, DotsPlayer
+import numpy as np
+import pytest
+import random
+
+def layer_experiences(player, played, count, rng):
+    """Distinct experiences starting from states with played edges drawn, so no update of the batch changes the
+    target of another"""
+    q = player.table
+    states = np.array([ s for s in range(q.num_states) if bin(s).count('1') == played ], dtype=np.int64)
+    experiences = q.sample_experiences(10 * count, rng)
+    experiences = experiences[np.isin(experiences[:, 0], states)]
+    keys = experiences[:, 0] * q.lines + experiences[:, 1]
+    experiences = experiences[np.unique(keys, return_index=True)[1]][:count]
+    assert len(experiences) > 10
+    return experiences
+
+@pytest.mark.parametrize('duplicates', ['last', 'mean'])
+@pytest.mark.parametrize('kind', [{}, { 'canonical': True }, { 'lazy': True }])
+def test_batch_matches_single_moves_without_duplicates(duplicates, kind):
+    rng = np.random.default_rng(0)
+    batch = DotsPlayer(2, 2, **kind)
+    single = DotsPlayer(2, 2, **kind)
+    for player in (batch, single):
+        player.alpha = 0.5
+    random.seed(0)
+    batch.learn_from_games(300)
+    random.seed(0)
+    single.learn_from_games(300)
+
+    experiences = layer_experiences(batch, 6, 200, rng)
+    if kind.get('canonical'):
+        keys = batch.table.locate_batch(experiences[:, 0], experiences[:, 1])
+        experiences = experiences[np.unique(keys[0] * batch.lines + keys[1], return_index=True)[1]]
+    batch.learn_from_batch(*experiences.T, duplicates=duplicates)
+    for old_state, move, new_state, reward, best_move in experiences.tolist():
+        single.learn_from_move(old_state, move, new_state, reward, None if best_move < 0 else best_move)
+
+    states = experiences[:, 0]
+    assert np.allclose(batch.table.peek_batch(states), single.table.peek_batch(states))
+
+def test_duplicates_keep_the_last_or_the_mean_target():
+    player = DotsPlayer(1, 2)
+    q = player.table
+    state, move = 0, 0
+    new_state = q.transition(state, move)
+    bests = player.legal_moves(new_state)[:3]
+    q.values[new_state, bests] = [1, 2, 4]
+    targets = { best: -q.get(new_state, best) for best in bests }
+
+    experiences = np.array([ (state, move, new_state, 0, best) for best in bests ])
+    player.learn_from_batch(*experiences.T, duplicates='last')
+    assert q.get(state, move) == targets[bests[-1]]
+    player.learn_from_batch(*experiences.T, duplicates='mean')
+    assert q.get(state, move) == pytest.approx(np.mean([ targets[b] for b in bests ]))
+    with pytest.raises(ValueError):
+        player.learn_from_batch(*experiences.T, duplicates='first')
+
+@pytest.mark.parametrize('kind', [{}, { 'canonical': True }])
+def test_sweeping_converges_to_the_solver(kind):
+    player = DotsPlayer(2, 2, **kind)
+    player.is_fully_trained_sweeping()
+    result = player.compare_to_exact()
+    assert result['max_error'] < 0.01
+    assert result['optimal_moves'] == 1.0
+
+def test_sweeping_a_lazy_table_after_some_games():
+    random.seed(0)
+    player = DotsPlayer(2, 2, lazy=True)
+    player.learn_from_games(200)
+    stored = player.table.size
+    assert player.prioritized_sweeping() > 0
+    assert player.table.size > stored
+
+    exact = DotsPlayer(2, 2)
+    exact.solve()
+    states = player.table.states
+    assert np.abs(player.table.values - exact.table.values[states]).max() < 0.01
+
+def test_sweeping_an_empty_lazy_table_is_refused():
+    player = DotsPlayer(2, 2, lazy=True)
+    with pytest.raises(ValueError):
+        player.is_fully_trained_sweeping()
+
+def test_prioritized_replay_converges_to_the_solver():
+    random.seed(0)
+    player = DotsPlayer(1, 2)
+    player.is_fully_trained_prioritized()
+    assert player.compare_to_exact()['max_error'] < 0.01
+
+def test_tracker_waits_for_a_window_of_quiet_batches():
+    tracker = ConvergenceTracker(tolerance=0.1, window=2, rows=3)
+    tracker.record(0.5, 1)
+    tracker.record_batch(np.array([0.05, 0.2, 0.3]), np.array([0, 2, 2]))
+    assert tracker.end_batch() == 0.5
+    assert tracker.changes.tolist() == [0, 1, 2]
+
+    tracker.record(0.05, 0)
+    assert tracker.end_batch() == 0.05
+    assert not tracker.converged()
+    tracker.record_batch(np.array([]), np.array([], dtype=np.int64))
+    assert tracker.end_batch() == 0.0
+    assert tracker.converged()
+    assert tracker.trace == [0.5, 0.05, 0.0]
+
+def test_training_stops_once_the_tracker_converges():
+    random.seed(0)
+    player = DotsPlayer(1, 2)
+    tracker = ConvergenceTracker(tolerance=0.01, rows=player.table.num_states)
+    count, trace = player.is_fully_trained(tracker, return_trace=True)
+    assert count == 1000 * len(trace)
+    assert trace[-1] <= 0.01 < max(trace)
+    assert player.tracker is None
+    assert tracker.changes.sum() > 0
@@ -0,0 +1,120 @@
+from DotsPlayer import ConvergenceTracker, DotsPlayer
+from DotsQTable import HEADER, load_table, move_tables
+import numpy as np
+import pytest
+import random
+
+@pytest.mark.parametrize('n, m', [(1, 2), (2, 2)])
+def test_symmetric_states_share_a_canonical_row(n, m):
+    player = DotsPlayer(n, m, canonical=True)
+    player.solve()
+    q = player.table
+    states = np.repeat(np.arange(q.num_states, dtype=np.int64), q.lines)
+    moves = np.tile(np.arange(q.lines), q.num_states)
+    bits = np.array(player.edge_bits, dtype=np.int64)
+
+    rows, columns = q.locate_batch(states, moves)
+    images, image_moves = player.apply_symmetries(states, moves)
+    after = player.apply_symmetries(states | bits[moves], moves)[0]
+    for k in range(len(player.symmetries)):
+        assert np.array_equal(images[:, k] | bits[image_moves[:, k]], after[:, k])
+        image_rows, image_columns = q.locate_batch(images[:, k], image_moves[:, k])
+        assert np.array_equal(image_rows, rows)
+        assert np.array_equal(q.values[image_rows, image_columns], q.values[rows, columns])
+
+def test_canonical_rows_hold_their_representatives():
+    player = DotsPlayer(2, 2, canonical=True)
+    q = player.table
+    assert np.array_equal(q.row_states()[q.row_of], [ min(player.symmetric_states(s)) for s in range(q.num_states) ])
+
+def test_canonical_table_reads_like_a_dense_one():
+    dense = DotsPlayer(2, 2)
+    canonical = DotsPlayer(2, 2, canonical=True)
+    dense.solve()
+    canonical.solve()
+    for state in range(0, dense.table.num_states, 7):
+        assert np.array_equal(canonical.table.row(state), dense.table.row(state))
+        assert canonical.table.reward(state, 0) == dense.table.reward(state, 0)
+
+@pytest.mark.parametrize('kind', [{}, { 'canonical': True }])
+def test_checkpoints_round_trip(tmp_path, kind):
+    path = tmp_path / 'player.npq'
+    player = DotsPlayer(2, 2, **kind)
+    player.solve()
+    player.alpha, player.gamma, player.count = 0.5, 0.9, 1234
+    player.save(path)
+
+    for mmap_mode in ('r', 'c', 'r+', None):
+        loaded = DotsPlayer.load(path, mmap_mode)
+        assert type(loaded.table) is type(player.table)
+        assert (loaded.alpha, loaded.gamma, loaded.count) == (0.5, 0.9, 1234)
+        for name in player.table.shared:
+            assert np.array_equal(getattr(loaded.table, name), getattr(player.table, name))
+        assert isinstance(loaded.qtable, np.memmap) == (mmap_mode is not None)
+
+def test_checkpoint_modes_decide_what_reaches_the_file(tmp_path):
+    path = tmp_path / 'player.npq'
+    player = DotsPlayer(1, 2)
+    player.solve()
+    player.save(path)
+
+    with pytest.raises(ValueError):
+        DotsPlayer.load(path, 'r').qtable[0, 0] = 5
+    copied = DotsPlayer.load(path, 'c')
+    copied.qtable[0, 0] = 5
+    del copied
+    assert DotsPlayer.load(path).qtable[0, 0] == player.qtable[0, 0]
+    in_place = DotsPlayer.load(path, 'r+')
+    in_place.qtable[0, 0] = 5
+    in_place.qtable.flush()
+    del in_place
+    assert DotsPlayer.load(path).qtable[0, 0] == 5
+
+    other = tmp_path / 'other.npq'
+    other.write_bytes(b'\0' * HEADER.size)
+    with pytest.raises(ValueError):
+        load_table(other)
+
+def test_lazy_lookups_for_play_do_not_add_rows():
+    player = DotsPlayer(2, 2, lazy=True)
+    player.learn_from_games(50)
+    q = player.table
+    size = q.size
+    states = np.random.default_rng(0).integers(0, q.num_states - 1, 500)
+
+    values = q.peek_batch(states)
+    q.best_moves(states, np.random.default_rng(0))
+    assert q.size == size
+    assert np.array_equal(values[[ s not in q.index for s in states.tolist() ]],
+                          move_tables(2, 2, states[[ s not in q.index for s in states.tolist() ]])[1])
+
+    rows, columns = q.locate_batch(states[:, None], np.arange(q.lines))
+    assert np.array_equal(values, q.values[rows, columns])
+
+def test_lazy_checkpoints_load_empty_and_keep_growing(tmp_path):
+    path = tmp_path / 'lazy.npq'
+    DotsPlayer(2, 2, lazy=True).save(path)
+    for mmap_mode in ('r', 'c', 'r+', None):
+        player = DotsPlayer.load(path, mmap_mode)
+        assert player.table.size == 0
+        player.learn_from_games(20)
+        assert player.table.size > 0
+
+    random.seed(0)
+    trained = DotsPlayer(2, 2, lazy=True)
+    trained.learn_from_games(100)
+    trained.save(path)
+    player = DotsPlayer.load(path, 'r+')
+    assert not isinstance(player.table.values, np.memmap)
+    player.learn_from_games(100)
+    assert np.array_equal(DotsPlayer.load(path).table.values, trained.table.values)
+
+def test_tracker_grows_with_a_lazy_table():
+    random.seed(0)
+    player = DotsPlayer(2, 2, lazy=True)
+    player.learn_from_games(10)
+    tracker = ConvergenceTracker(rows=player.table.size)
+    player.is_fully_trained(tracker)
+    assert len(tracker.changes) >= player.table.size
+    assert tracker.changes[player.table.size:].sum() == 0
+    assert tracker.changes.sum() > 0
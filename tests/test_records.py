@@ -0,0 +1,127 @@
+import DotsBoard as Dots
+import DotsRecord
+from DotsPlayer import DotsPlayer
+from DotsRecord import RecordReader, RecordWriter, read_experiences, record_self_play, replay
+import itertools
+import numpy as np
+import os
+import pytest
+import random
+
+def test_varints_round_trip():
+    values = [0, 1, 127, 128, 300, 2**20, 2**40]
+    decoded, used = DotsRecord.decode_varints(DotsRecord.encode_varints(values) + b'\x80')
+    assert decoded.tolist() == values
+    assert used == len(DotsRecord.encode_varints(values))
+
+def test_games_round_trip(tmp_path):
+    path = tmp_path / 'games.rec'
+    rng = random.Random(0)
+    boards = []
+    with RecordWriter(path, 2, 2) as writer:
+        for game in range(50):
+            board = Dots.DotsBoard(2, 2)
+            for k in range(rng.randrange(board.lines + 1)):
+                board.play(rng.choice(board.legal_moves()))
+            writer.write_board(board)
+            boards.append(board)
+
+    games = list(RecordReader(path, chunk_size=16))
+    assert games == [ (board.order(), (board.score1, board.score2)) for board in boards ]
+
+    moves, scores = next(RecordReader(path).batches(100))
+    assert moves.shape == (50, 12)
+    assert [ row[row >= 0].tolist() for row in moves ] == [ board.order() for board in boards ]
+
+def test_replay_matches_the_board(tmp_path):
+    path = tmp_path / 'games.rec'
+    record_self_play(path, 2, 2, 30, seed=1)
+    moves, scores = next(RecordReader(path).batches(30))
+    states, played, new_states, rewards = replay(moves, 2, 2)
+
+    expected = []
+    for row in moves:
+        board = Dots.DotsBoard(2, 2)
+        for move in row[row >= 0].tolist():
+            before = board.state, board.score()
+            board.play(move)
+            expected.append((before[0], move, board.state, board.score() - before[1]))
+    assert np.array_equal(np.stack([states, played, new_states, rewards], axis=1), expected)
+
+    twice = moves.copy()
+    twice[0, 1] = twice[0, 0]
+    with pytest.raises(ValueError):
+        replay(twice, 2, 2)
+
+def test_experiences_need_a_table(tmp_path):
+    path = tmp_path / 'games.rec'
+    record_self_play(path, 1, 2, 20, seed=2)
+    player = DotsPlayer(1, 2)
+    experiences = np.concatenate(list(read_experiences(path, player.table, batch_games=7)))
+    assert experiences.shape == (20 * player.lines, 5)
+    assert np.all((experiences[:, 4] >= 0) == (experiences[:, 2] != (1 << player.lines) - 1))
+    with pytest.raises(ValueError):
+        next(read_experiences(path, None))
+
+def test_appending_drops_a_game_cut_off(tmp_path):
+    path = tmp_path / 'games.rec'
+    record_self_play(path, 2, 2, 10, seed=3)
+    size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(bytes([5, 1, 2]))
+
+    with RecordWriter(path, 2, 2) as writer:
+        writer.write([0, 1], (0, 0))
+    games = list(RecordReader(path))
+    assert len(games) == 11
+    assert games[-1] == ([0, 1], (0, 0))
+    assert os.path.getsize(path) == size + 5
+
+def test_bad_files_raise_value_error(tmp_path):
+    short = tmp_path / 'short.rec'
+    short.write_bytes(b'DOTS')
+    with pytest.raises(ValueError):
+        RecordReader(short)
+    with pytest.raises(ValueError):
+        RecordWriter(short, 2, 2)
+
+    path = tmp_path / 'games.rec'
+    record_self_play(path, 2, 2, 5, seed=4)
+    with pytest.raises(ValueError):
+        RecordWriter(path, 3, 3)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1)
+    with pytest.raises(ValueError):
+        RecordReader(path)
+
+    with open(path, 'r+b') as f:
+        data = f.read()
+        f.seek(0)
+        f.write(DotsRecord.HEADER.pack(DotsRecord.MAGIC, DotsRecord.VERSION, 2, 2, len(data) - 1, 5))
+    with pytest.raises(ValueError):
+        list(RecordReader(path))
+
+def test_only_flushed_games_are_read(tmp_path):
+    path = tmp_path / 'games.rec'
+    writer = RecordWriter(path, 1, 1)
+    writer.write([0, 1, 2, 3], (1, 0))
+    writer.flush()
+    writer.write([3, 2, 1, 0], (0, 1))
+    reader = RecordReader(path)
+    assert reader.games == 1
+    assert list(reader) == [([0, 1, 2, 3], (1, 0))]
+
+    writer.close()
+    reader = RecordReader(path)
+    assert reader.games == 2
+    assert [ moves for moves, scores in reader ] == [[0, 1, 2, 3], [3, 2, 1, 0]]
+
+def test_split_records_finds_every_game():
+    rng = np.random.default_rng(5)
+    counts = rng.integers(0, 30, 200)
+    values = np.concatenate([ np.concatenate([[count], rng.integers(0, 300, count + 2)]) for count in counts ])
+    starts = np.concatenate([[0], np.cumsum(counts + 3)])
+    for levels, cut in itertools.product((0, 2, 4), (len(values), len(values) - 1, int(starts[57]), 2)):
+        found, used = DotsRecord.split_records(values[:cut], levels)
+        assert np.array_equal(found, starts[:-1][starts[1:] <= cut])
+        assert used == max([ end for end in starts if end <= cut ])
@@ -0,0 +1,40 @@
+import DotsBoard as Dots
+from DotsPlayer import DotsPlayer
+from DotsSearch import SearchPlayer
+import pytest
+import random
+
+@pytest.mark.parametrize('endgame', [True, False])
+def test_full_depth_search_plays_optimal_moves(endgame):
+    exact = DotsPlayer(2, 2)
+    values = exact.solve()
+    player = SearchPlayer(2, 2, time_limit=None, seed=0, endgame=endgame)
+    rng = random.Random(0)
+    states = rng.sample([ s for s in range(exact.table.num_states - 1) if bin(s).count('1') >= 5 ], 40)
+
+    for state in states:
+        legal = exact.legal_moves(state)
+        move = player.best_move(state)
+        assert values[state, move] == max(values[state, legal])
+        assert player.search(state, len(legal))[0] == max(values[state, legal])
+
+def test_best_move_takes_any_board_form():
+    player = SearchPlayer(1, 2, time_limit=None, seed=0)
+    board = Dots.DotsBoard(1, 2)
+    for move in (0, 3, 6):
+        board.play(move)
+    move = player.best_move(board)
+    assert player.best_move(board.show_board()) == player.best_move(board.state) == move
+    assert move in board.legal_moves()
+
+    while board.legal_moves():
+        board.play(player.best_move(board))
+    assert player.best_move(board) is None
+    assert player.random_move(board) is None
+
+def test_a_time_limit_still_returns_a_legal_move():
+    player = SearchPlayer(3, 3, time_limit=0.05, seed=0)
+    board = Dots.DotsBoard(3, 3)
+    move = player.best_move(board)
+    assert move in board.legal_moves()
+    assert player.depth >= 1
@@ -0,0 +1,125 @@
+import DotsBoard as Dots
+from DotsPlayer import DotsPlayer
+from DotsServer import MatchServer, load_test
+import asyncio
+import json
+
+def solved(n, m):
+    player = DotsPlayer(n, m)
+    return player, player.solve()
+
+class Client:
+    """A test connection that sends one JSON request per line and reads the replies"""
+
+    def __init__ ( self, reader, writer ):
+        self.reader = reader
+        self.writer = writer
+
+    def send(self, request):
+        self.writer.write(json.dumps(request).encode() + b'\n')
+
+    async def receive(self):
+        return json.loads(await self.reader.readline())
+
+    async def call(self, request):
+        self.send(request)
+        return await self.receive()
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+async def connect(server):
+    return Client(*await asyncio.open_connection('127.0.0.1', server.port))
+
+def serve(players, test):
+    async def main():
+        server = MatchServer(players, seed=0)
+        await server.start('127.0.0.1', 0)
+        try:
+            await test(server)
+        finally:
+            server.close()
+    asyncio.run(main())
+
+def test_a_game_against_a_solved_player():
+    player, values = solved(1, 2)
+
+    async def test(server):
+        client = await connect(server)
+        assert (await client.call({ 'op': 'players' }))['players'] == { '1x2': [1, 2] }
+        reply = await client.call({ 'op': 'new', 'player': '1x2', 'first': False, 'id': 'a' })
+        assert reply['id'] == 'a' and reply['moves']
+        board = Dots.DotsBoard(1, 2)
+
+        while True:
+            for move in reply['moves']:
+                assert values[board.state, move] == max(values[board.state, board.legal_moves()])
+                board.play(move)
+            assert reply['state'] == board.state
+            if reply['done']:
+                break
+            assert 'error' in await client.call({ 'op': 'move', 'game': reply['game'], 'move': board.order()[0] })
+            move = board.legal_moves()[0]
+            board.play(move)
+            reply = await client.call({ 'op': 'move', 'game': reply['game'], 'move': move })
+
+        assert reply['scores'] == [board.score2, board.score1]
+        assert server.games == {}
+        assert 'error' in await client.call({ 'op': 'move', 'game': reply['game'], 'move': 0 })
+        assert 'error' in await client.call({ 'op': 'dance' })
+        await client.close()
+
+    serve({ '1x2': player }, test)
+
+def test_concurrent_lookups_are_batched():
+    player, values = solved(2, 2)
+    states = list(range(0, player.table.num_states - 1, 17))
+
+    async def test(server):
+        client = await connect(server)
+        for state in states:
+            client.send({ 'op': 'best_move', 'player': '2x2', 'board': format(state, 'b').zfill(12), 'id': state })
+        replies = [ await client.receive() for state in states ]
+        for reply in replies:
+            state = reply['id']
+            assert values[state, reply['move']] == max(values[state, player.legal_moves(state)])
+        metrics = await client.call({ 'op': 'metrics' })
+        assert metrics['counters']['batches'] < len(states)
+        assert 'error' in await client.call({ 'op': 'best_move', 'player': '2x2', 'board': 2**12 - 1 })
+        await client.close()
+
+    serve({ '2x2': player }, test)
+
+def test_games_of_a_closed_connection_are_dropped():
+    player, values = solved(1, 2)
+
+    async def test(server):
+        client = await connect(server)
+        for first in (True, True, False):
+            await client.call({ 'op': 'new', 'player': '1x2', 'first': first })
+        other = await connect(server)
+        kept = await other.call({ 'op': 'new', 'player': '1x2' })
+        assert len(server.games) == 4
+
+        await client.close()
+        for attempt in range(100):
+            if len(server.games) == 1:
+                break
+            await asyncio.sleep(0.01)
+        assert list(server.games) == [kept['game']]
+        assert server.metrics.counters['games_abandoned'] == 3
+        await other.close()
+
+    serve({ '1x2': player }, test)
+
+def test_load_test_plays_every_game():
+    player, values = solved(1, 2)
+
+    async def test(server):
+        result = await load_test('127.0.0.1', server.port, '1x2', clients=5, games=3, seed=0)
+        assert result['games'] == 15
+        assert result['server']['counters']['games_finished'] == 15
+        assert result['server']['games'] == 0
+
+    serve({ '1x2': player }, test)
@@ -0,0 +1,54 @@
+from DotsPlayer import DotsPlayer
+from DotsShared import SharedTable, attach, release
+import numpy as np
+import pytest
+import random
+
+@pytest.mark.parametrize('kind', [{}, { 'canonical': True }])
+def test_workers_see_the_shared_table(kind):
+    player = DotsPlayer(1, 2, **kind)
+    player.solve()
+    expected = { name: getattr(player.table, name).copy() for name in player.table.shared }
+    shared = SharedTable(player.table)
+
+    table, blocks = attach(shared.spec())
+    try:
+        for name, array in expected.items():
+            assert np.array_equal(getattr(table, name), array)
+        player.table.values[0, 0] = 42
+        assert table.values[0, 0] == 42
+        with pytest.raises(ValueError):
+            table.values[0, 0] = 0
+        del table
+    finally:
+        release(blocks, False)
+
+    shared.close()
+    assert not shared.stale()
+    player.table.values[0, 0] = 7
+    assert player.table.get(0, 0) == 7
+
+def test_generate_multiple_experiences_samples_valid_moves():
+    random.seed(0)
+    player = DotsPlayer(1, 2)
+    player.solve()
+    player.num_cores = 2
+    try:
+        experiences = player.generate_multiple_experiences(101)
+    finally:
+        player.pool.close()
+        player.pool.join()
+        player.pool.clear()
+        player.shared.close()
+
+    q = player.table
+    assert experiences.shape == (101, 5)
+    for state, move, new_state, reward, best_move in experiences.tolist():
+        assert move in player.legal_moves(state)
+        assert new_state == q.transition(state, move)
+        assert reward == q.reward(state, move)
+        legal = player.legal_moves(new_state)
+        if legal:
+            assert q.get(new_state, best_move) == max(q.get(new_state, k) for k in legal)
+        else:
+            assert best_move == -1
@@ -0,0 +1,45 @@
+import DotsBoard as Dots
+from DotsSimulator import BatchSimulator
+import numpy as np
+import pytest
+
+@pytest.mark.parametrize('n, m', [(1, 1), (2, 2), (2, 3)])
+def test_batches_play_like_boards(n, m):
+    sim = BatchSimulator(n, m, 64, seed=0)
+    boards = [ Dots.DotsBoard(n, m) for game in range(sim.num_games) ]
+
+    while not sim.done.all():
+        actions = sim.actions((None, None))
+        rewards = sim.step(actions)
+        for board, action, reward in zip(boards, actions.tolist(), rewards.tolist()):
+            if action < 0:
+                assert board.moves_remaining() == 0
+                continue
+            before = board.score()
+            board.play(action)
+            assert board.score() - before == reward
+        assert sim.states.tolist() == [ board.state for board in boards ]
+        assert sim.turn.tolist() == [ board.turn for board in boards ]
+        assert sim.scores.tolist() == [ [board.score1, board.score2] for board in boards ]
+
+    assert np.all(sim.scores.sum(axis=1) == n * m)
+    assert np.array_equal(sim.results(), np.sign(sim.scores[:, 0].astype(np.int32) - sim.scores[:, 1]))
+
+def test_rollouts_record_every_move():
+    sim = BatchSimulator(2, 2, 10, seed=1)
+    scores, played = sim.rollout(record=True)
+    assert len(played) == 10 * sim.lines
+    assert np.array_equal(played[:, 2], played[:, 0] | sim.bits[played[:, 1]])
+    assert played[:, 3].sum() == scores.sum() == 10 * 4
+
+def test_reset_and_illegal_moves():
+    sim = BatchSimulator(1, 2, 4, seed=2)
+    sim.rollout()
+    sim.reset(np.array([0, 2]))
+    assert sim.done.tolist() == [False, True, False, True]
+    assert sim.states[0] == sim.states[2] == 0
+    assert sim.legal_mask()[0].all()
+
+    sim.step(np.array([3, -1, 3, -1]))
+    with pytest.raises(ValueError):
+        sim.step(np.array([3, -1, -1, -1]))